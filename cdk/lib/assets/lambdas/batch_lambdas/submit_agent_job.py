@@ -38,6 +38,8 @@ def on_create(event, physical_id):
     q_app_data_source_id = os.environ['Q_APP_DATA_SOURCE_ID']
     enable_graph = os.environ['ENABLE_GRAPH']
     neptune_graph_id = os.environ['NEPTUNE_GRAPH_ID']
+    # The prebaked image has the scripts and their dependencies, nothing is installed when the job starts
+    prebaked_image = os.environ.get("PREBAKED_IMAGE", "false") == "true"
     
     print("Getting AP id and index...")
     q_app_id = get_q_app_id(q_app_name)
@@ -89,6 +91,10 @@ def on_create(event, physical_id):
             "sh","-c",f"yum -y install python-pip && pip install awscli boto3 pandas langchain langchain-community langchain-aws pexpect && aws s3 cp --recursive s3://{s3_bucket}/research-agent/ . && python3 main.py"
         ]
     }
+    if prebaked_image:
+        container_overrides["command"] = [
+            "sh","-c","cd /app/research-agent && python3 main.py"
+        ]
 
     if enable_graph == 'true':
         container_overrides["environment"].append({
@@ -8,6 +8,8 @@ def on_event(event, context):
     physical_id = "PhysicalIdAmazonQCodeAnalysisApp"
     request_type = event['RequestType']
     if request_type == 'Create': return on_create(event, physical_id=physical_id)
+    # The refresh schedule invokes the Lambda directly, without a custom resource
+    if request_type == 'Scheduled': return submit_job(physical_id)
     physical_id = event['PhysicalResourceId']
     if request_type == 'Update': return on_update(event, physical_id=physical_id)
     if request_type == 'Delete': return on_delete(event, physical_id=physical_id)
@@ -16,14 +18,17 @@ def on_event(event, context):
 def on_update(event, physical_id):
     props = event["ResourceProperties"]
     print("update resource %s with props %s" % (physical_id, props))
-
-    return { 'PhysicalResourceId': physical_id }
+    # The properties are the parameters of the run, a stack update that changes them runs the job again
+    return submit_job(physical_id)
 
 def on_delete(event, physical_id):
     print("delete resource %s" % physical_id)
     return { 'PhysicalResourceId': physical_id }
 
 def on_create(event, physical_id):
+    return submit_job(physical_id)
+
+def submit_job(physical_id):
     aws_batch = boto3.client('batch')
     batch_job_queue = os.environ.get("BATCH_JOB_QUEUE")
     batch_job_definition = os.environ.get("BATCH_JOB_DEFINITION")
@@ -38,6 +43,17 @@ def on_create(event, physical_id):
     q_app_data_source_id = os.environ['Q_APP_DATA_SOURCE_ID']
     enable_graph = os.environ['ENABLE_GRAPH']
     neptune_graph_id = os.environ['NEPTUNE_GRAPH_ID']
+    incremental = os.environ.get("INCREMENTAL", "false")
+    graph_extractor = os.environ.get("GRAPH_EXTRACTOR", "static")
+    # The manifest of the previous run lives outside the code-processing prefix, which is replaced on deploy
+    manifest_location = f"s3://{s3_bucket}/manifests/{repo_url.split('://')[-1][:-4]}.json"
+    # Progress of an interrupted run, the job is retried and resumes from it
+    checkpoint_location = f"s3://{s3_bucket}/checkpoints/{repo_url.split('://')[-1][:-4]}.json"
+    job_attempts = int(os.environ.get("JOB_ATTEMPTS", "3"))
+    # Optional split the files of the repository across the children of an array job
+    shards = int(os.environ.get("SHARDS", "1"))
+    # The prebaked image has the scripts and their dependencies, nothing is installed when the job starts
+    prebaked_image = os.environ.get("PREBAKED_IMAGE", "false") == "true"
 
     container_overrides = {
         "environment": [{
@@ -75,12 +91,55 @@ def on_create(event, physical_id):
         {
             "name": "ENABLE_GRAPH",
             "value": enable_graph
+        },
+        {
+            "name": "INCREMENTAL",
+            "value": incremental
+        },
+        {
+            "name": "GRAPH_EXTRACTOR",
+            "value": graph_extractor
+        },
+        {
+            "name": "MANIFEST_LOCATION",
+            "value": manifest_location
+        },
+        {
+            "name": "LLM_CACHE_LOCATION",
+            "value": f"s3://{s3_bucket}/llm-cache/"
+        },
+        {
+            "name": "CHECKPOINT_LOCATION",
+            "value": checkpoint_location
+        },
+        {
+            "name": "JOB_ATTEMPTS",
+            "value": str(job_attempts)
+        },
+        {
+            "name": "METRICS_LOCATION",
+            "value": f"s3://{s3_bucket}/metrics/{repo_url.split('://')[-1][:-4]}/{datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}.json"
         }
         ],
         "command": [
-            "sh","-c",f"yum -y install python-pip git && pip install boto3 awscli GitPython && aws s3 cp s3://{s3_bucket}/code-processing/generate_documentation_and_ingest_code.py . && python3 generate_documentation_and_ingest_code.py"
+            "sh","-c",f"yum -y install python-pip git && pip install boto3 awscli GitPython && start=$(date +%s) && aws s3 cp --recursive s3://{s3_bucket}/code-processing/ . && COPY_SECONDS=$(($(date +%s) - start)) python3 generate_documentation_and_ingest_code.py"
         ]
     }
+    if prebaked_image:
+        container_overrides["command"] = [
+            "sh","-c","cd /app/code-processing && python3 generate_documentation_and_ingest_code.py"
+        ]
+
+    # Optional ingest the repositories of a JSON list instead of REPO_URL, the stack parameter defaults to None
+    repositories = os.environ.get("REPOSITORIES", "None")
+    # Every shard of an array job would fail, before the sync job started for them is ever stopped
+    if repositories != "None" and shards > 1:
+        raise ValueError("Repositories cannot be combined with Shards greater than 1, set one of them")
+    if repositories != "None":
+        container_overrides["environment"].append({
+            "name": "REPOSITORIES",
+            "value": repositories
+        })
 
     if enable_graph == 'true':
         container_overrides["environment"].append({
@@ -88,11 +147,61 @@ def on_create(event, physical_id):
             "value": neptune_graph_id
         })
 
+    # The graph is created empty with the stack, so the static graph of the first run is loaded with one bulk import task
+    graph_import_role_arn = os.environ.get("GRAPH_IMPORT_ROLE_ARN")
+    if enable_graph == 'true' and graph_extractor == 'static' and graph_import_role_arn and repositories == "None":
+        container_overrides["environment"] += [{
+            "name": "GRAPH_EXPORT_LOCATION",
+            "value": f"s3://{s3_bucket}/graph-export/{repo_url.split('://')[-1][:-4]}/"
+        },
+        {
+            "name": "GRAPH_IMPORT_ROLE_ARN",
+            "value": graph_import_role_arn
+        }]
+
     batch_job_name = f"aws-batch-job-code-analysis{datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}"
+    if shards > 1:
+        return submit_sharded_jobs(aws_batch, batch_job_name, batch_job_queue, batch_job_definition, container_overrides, shards, job_attempts, physical_id)
     print(f"Submitting job {batch_job_name} to queue {batch_job_queue} with definition {batch_job_definition} and container overrides {container_overrides}")
     response = aws_batch.submit_job(jobName=batch_job_name,
                                 jobQueue=batch_job_queue,
                                 jobDefinition=batch_job_definition,
-                                containerOverrides=container_overrides)
+                                containerOverrides=container_overrides,
+                                retryStrategy={'attempts': job_attempts})
     print(json.dumps(response))
     return { 'PhysicalResourceId': physical_id}
+
+def submit_sharded_jobs(aws_batch, batch_job_name, batch_job_queue, batch_job_definition, container_overrides, shards, job_attempts, physical_id):
+    """
+    Submit an array job with one child per shard of the files, and a reduce job that runs once every child finished.
+    The shards share one sync job, started here and stopped by the reduce job.
+    """
+    amazon_q = boto3.client('qbusiness')
+    sync_job_id = amazon_q.start_data_source_sync_job(
+        applicationId=os.environ['AMAZON_Q_APP_ID'],
+        dataSourceId=os.environ['Q_APP_DATA_SOURCE_ID'],
+        indexId=os.environ['Q_APP_INDEX']
+    )['executionId']
+    shard_environment = container_overrides["environment"] + [
+        {"name": "SHARD_COUNT", "value": str(shards)},
+        {"name": "SYNC_JOB_ID", "value": sync_job_id},
+    ]
+    print(f"Submitting array job {batch_job_name} with {shards} shards to queue {batch_job_queue}")
+    response = aws_batch.submit_job(jobName=batch_job_name,
+                                jobQueue=batch_job_queue,
+                                jobDefinition=batch_job_definition,
+                                arrayProperties={'size': shards},
+                                containerOverrides=dict(container_overrides, environment=shard_environment),
+                                retryStrategy={'attempts': job_attempts})
+    print(json.dumps(response))
+    # A dependency on the array job waits for all of its children. It only runs when every child succeeded,
+    # a shard failing on its last attempt records the failure and exits successfully.
+    reduce_environment = shard_environment + [{"name": "INGESTION_MODE", "value": "reduce"}]
+    reduce_response = aws_batch.submit_job(jobName=f"{batch_job_name}-reduce",
+                                jobQueue=batch_job_queue,
+                                jobDefinition=batch_job_definition,
+                                dependsOn=[{'jobId': response['jobId']}],
+                                containerOverrides=dict(container_overrides, environment=reduce_environment),
+                                retryStrategy={'attempts': job_attempts})
+    print(json.dumps(reduce_response))
+    return { 'PhysicalResourceId': physical_id}
@@ -0,0 +1,65 @@
+import boto3
+import os
+import threading
+from botocore.config import Config
+
+# Connections kept open per client. Every worker thread calling a service needs one,
+# above the pool size requests wait for a free connection.
+MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50'))
+# Botocore retries of the calls that do not go through an AdaptiveRateLimiter. Adaptive mode also slows the client down on throttling.
+RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+# Clients whose calls go through an AdaptiveRateLimiter send every request once: the limiter retries it and sees
+# every throttling error, instead of botocore absorbing them and multiplying the attempts of the limiter.
+RATE_LIMITED_RETRIES = {'mode': 'standard', 'total_max_attempts': 1}
+CONNECT_TIMEOUT = int(os.environ.get('AWS_CONNECT_TIMEOUT', '10'))
+# Seconds to wait for a response, by service. Completions of long files take minutes, the other calls seconds.
+READ_TIMEOUTS = {
+    'bedrock-runtime': 300,
+    'neptune-graph': 120,
+    'qbusiness': 120,
+}
+DEFAULT_READ_TIMEOUT = 60
+
+_clients = {}
+# The default boto3 session is not thread safe, clients are created one at a time
+_lock = threading.Lock()
+
+def read_timeout(service_name):
+    """Return the read timeout of a service, overridden by i.e. BEDROCK_RUNTIME_READ_TIMEOUT."""
+    variable = f"{service_name.upper().replace('-', '_')}_READ_TIMEOUT"
+    return int(os.environ.get(variable, READ_TIMEOUTS.get(service_name, DEFAULT_READ_TIMEOUT)))
+
+def client_config(service_name, rate_limited=False):
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        retries=RATE_LIMITED_RETRIES if rate_limited else {'mode': RETRY_MODE, 'max_attempts': MAX_ATTEMPTS},
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=read_timeout(service_name),
+        # Idle pooled connections are kept alive between the bursts of requests
+        tcp_keepalive=True,
+    )
+
+def get_client(service_name, region_name=None, rate_limited=False):
+    """
+    Return the client of a service shared by the whole process, created on first use.
+    Clients are thread safe, so every worker reuses the same connection pool instead of opening its own.
+    Args:
+        service_name (str): The service, i.e. bedrock-runtime.
+        region_name (str): Optional region, the default region of the environment otherwise.
+        rate_limited (bool): The calls of the client go through an AdaptiveRateLimiter, botocore does not retry them.
+    Returns:
+        client: The boto3 client.
+    """
+    key = (service_name, region_name, rate_limited)
+    with _lock:
+        if key not in _clients:
+            config = client_config(service_name, rate_limited)
+            _clients[key] = boto3.client(service_name, region_name=region_name, config=config)
+        return _clients[key]
+
+def register_client(service_name, client, region_name=None):
+    """Make get_client return the given client for a service, i.e. a stand-in when benchmarking without AWS."""
+    with _lock:
+        for rate_limited in (False, True):
+            _clients[(service_name, region_name, rate_limited)] = client
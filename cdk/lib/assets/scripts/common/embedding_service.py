@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class EmbeddingService:
+    """A class to generate text embeddings with one shared Bedrock client and a cache."""
+
+    def __init__(self, bedrock, model_id, cache_directory=None, max_cached_in_memory=1024, max_workers=8, limiter=None, metrics=None):
+        """Initialize EmbeddingService for the given embedding model.
+
+        Args:
+            bedrock: The bedrock-runtime client reused for every request.
+            model_id (str): The embedding model ID, i.e. amazon.titan-embed-text-v1.
+            cache_directory (str): Optional directory where embeddings are also cached on disk.
+            max_cached_in_memory (int): The least recently used embeddings are dropped from memory above this count.
+            max_workers (int): Number of texts embedded at the same time by embed_many.
+            limiter (AdaptiveRateLimiter): Optional rate limiter the Bedrock requests go through.
+            metrics (Metrics): Optional, records the duration of every embedding request.
+        """
+        self.bedrock = bedrock
+        self.model_id = model_id
+        self.cache_directory = cache_directory
+        self.max_cached_in_memory = max_cached_in_memory
+        self.limiter = limiter
+        self.metrics = metrics
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.memory_cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if cache_directory and not os.path.exists(cache_directory):
+            os.makedirs(cache_directory)
+
+    def embed(self, text):
+        """
+        Generate a vector of embeddings for a text input.
+        Args:
+            text (str): The text to embed.
+        Returns:
+            list: The embedding.
+        """
+        key = hashlib.sha256(f"{self.model_id}|{text}".encode('utf-8')).hexdigest()
+        embedding = self._get_cached(key)
+        if embedding is not None:
+            return embedding
+        request = {
+            'body': json.dumps({"inputText": text}),
+            'modelId': self.model_id,
+            'accept': "application/json",
+            'contentType': "application/json",
+        }
+        start = time.perf_counter()
+        if self.limiter is None:
+            response = self.bedrock.invoke_model(**request)
+        else:
+            response = self.limiter.call(self.bedrock.invoke_model, **request)
+        embedding = json.loads(response.get('body').read())['embedding']
+        if self.metrics:
+            self.metrics.record('embedding', time.perf_counter() - start)
+            self.metrics.increment('embedding_bytes_sent', len(request['body']))
+        self._put_cached(key, embedding)
+        return embedding
+
+    def embed_many(self, texts):
+        """
+        Embed many texts at the same time. The model takes one text per request,
+        so the requests are submitted concurrently and identical texts are only embedded once.
+        Args:
+            texts (list): The texts to embed.
+        Returns:
+            list: The embeddings, in the same order as texts.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        embeddings = dict(zip(unique_texts, self.executor.map(self.embed, unique_texts)))
+        return [embeddings[text] for text in texts]
+
+    def _get_cached(self, key):
+        with self.lock:
+            if key in self.memory_cache:
+                self.memory_cache.move_to_end(key)
+                self.hits += 1
+                return self.memory_cache[key]
+        embedding = None
+        if self.cache_directory:
+            path = os.path.join(self.cache_directory, f"{key}.json")
+            if os.path.exists(path):
+                with open(path, 'r') as f:
+                    embedding = json.load(f)
+        with self.lock:
+            if embedding is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._remember(key, embedding)
+        return embedding
+
+    def _put_cached(self, key, embedding):
+        with self.lock:
+            self._remember(key, embedding)
+        if self.cache_directory:
+            path = os.path.join(self.cache_directory, f"{key}.json")
+            # Write to a temporary file first so concurrent readers never see a partial file
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(embedding, f)
+            os.replace(tmp_path, path)
+
+    def _remember(self, key, embedding):
+        self.memory_cache[key] = embedding
+        self.memory_cache.move_to_end(key)
+        while len(self.memory_cache) > self.max_cached_in_memory:
+            self.memory_cache.popitem(last=False)
@@ -0,0 +1,100 @@
+import json
+import math
+import storage
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PERCENTILES = (50, 95, 99)
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list."""
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+class Metrics:
+    """A class to collect the duration of every stage of a run and its counters, shared by all workers."""
+
+    def __init__(self):
+        """Initialize Metrics with no recorded stage."""
+        self.lock = threading.Lock()
+        self.durations = defaultdict(list)
+        self.counters = defaultdict(int)
+
+    @contextmanager
+    def timer(self, stage):
+        """Record the duration of the enclosed block under stage, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.durations[stage].append(seconds)
+
+    def increment(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] += value
+
+    def summary(self):
+        """
+        Summarize the run.
+        Returns:
+            summary (dict): Per stage the count, total, p50, p95, p99 and max in seconds, and the counters.
+        """
+        with self.lock:
+            durations = {stage: sorted(values) for stage, values in self.durations.items()}
+            counters = dict(self.counters)
+        stages = {}
+        for stage, values in sorted(durations.items()):
+            stages[stage] = {'count': len(values), 'total': round(sum(values), 3)}
+            for p in PERCENTILES:
+                stages[stage][f"p{p}"] = round(percentile(values, p), 3)
+            stages[stage]['max'] = round(values[-1], 3)
+        return {'stages': stages, 'counters': dict(sorted(counters.items()))}
+
+    def emf_lines(self, namespace, dimensions=None, summary=None):
+        """
+        Format the summary as CloudWatch embedded metric format log lines, one per stage and one for the counters.
+        Args:
+            namespace (str): The CloudWatch namespace of the metrics.
+            dimensions (dict): Optional dimensions of every metric, i.e. the repository.
+            summary (dict): The summary to format, the current one by default.
+        Returns:
+            lines (list): JSON lines to print to the log.
+        """
+        summary = summary or self.summary()
+        dimensions = dimensions or {}
+        timestamp = int(time.time() * 1000)
+
+        def line(values, unit_of, extra_dimensions):
+            names = list(dimensions) + list(extra_dimensions)
+            return json.dumps({
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': namespace,
+                        'Dimensions': [names],
+                        'Metrics': [{'Name': name, 'Unit': unit_of(name)} for name in values],
+                    }],
+                },
+                **dimensions,
+                **extra_dimensions,
+                **values,
+            })
+
+        lines = []
+        for stage, stats in summary['stages'].items():
+            values = {f"p{p}": stats[f"p{p}"] for p in PERCENTILES}
+            values['max'] = stats['max']
+            lines.append(line(values, lambda name: 'Seconds', {'Stage': stage}))
+        if summary['counters']:
+            lines.append(line(summary['counters'], lambda name: 'Bytes' if name.endswith('bytes_sent') else 'Count', {}))
+        return lines
+
+def save_summary(location, summary):
+    """Write the summary as JSON to a local path or an s3://bucket/key URI."""
+    storage.write(location, json.dumps(summary, indent=2).encode('utf-8'))
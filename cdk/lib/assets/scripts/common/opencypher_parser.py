@@ -0,0 +1,365 @@
+import re
+
+# A single node CREATE is the start of the node pattern, at most one property map, then the end of the node pattern
+NODE_CREATE_START_PATTERN = re.compile(
+    r"""\s*CREATE\s*\(\s*(?P<variable>\w+)?\s*:\s*(?P<label>\w+|`[^`]+`)\s*""",
+    re.IGNORECASE
+)
+NODE_CREATE_END_PATTERN = re.compile(
+    r"""\s*\)\s*(?:RETURN\s+id\s*\(\s*(?P<returned>\w+)\s*\)(?:\s+AS\s+\w+)?)?\s*$""",
+    re.IGNORECASE
+)
+# The parts of a CREATE of nodes and paths, i.e. CREATE (a:Class {name: 'A'})-[:DEFINES]->(b:Function {name: 'f'}), (c:File)
+PATTERN_NODE_PATTERN = re.compile(r"""\s*\(\s*(?P<variable>\w+)?\s*(?::\s*(?P<label>\w+|`[^`]+`))?\s*""")
+PATTERN_NODE_END_PATTERN = re.compile(r"""\s*\)""")
+PATTERN_RELATIONSHIP_PATTERN = re.compile(
+    r"""\s*(?P<left><)?-\s*\[\s*\w*\s*:\s*(?P<type>\w+|`[^`]+`)\s*\]\s*-(?P<right>>)?"""
+)
+PATTERN_END_PATTERN = re.compile(r"""\s*(?:RETURN\b.*)?$""", re.IGNORECASE | re.DOTALL)
+TOKEN_PATTERN = re.compile(
+    r"""\s*(?:(?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")|(?P<number>-?\d+(?:\.\d+)?)"""
+    r"""|(?P<name>`[^`]+`|\w+)|(?P<symbol>[{}\[\]:,]))""",
+    re.DOTALL
+)
+# MATCH ... CREATE (a)-[:TYPE]->(b) between variables bound by the MATCH
+RELATIONSHIP_CREATE_PATTERN = re.compile(
+    r"""^(?P<match>\s*MATCH\b.*?)\bCREATE\b(?P<pattern>\s*\(\s*\w+\s*\)\s*-\s*\[[^\]]*\]\s*->\s*\(\s*\w+\s*\)\s*)$""",
+    re.IGNORECASE | re.DOTALL
+)
+ESCAPES = {'n': '\n', 't': '\t', 'r': '\r'}
+BRACKETS = {'(': ')', '[': ']', '{': '}'}
+STRING_PATTERN = re.compile(r"""'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`""", re.DOTALL)
+# Statements generated for the graph may only add to it
+WRITE_CLAUSES = {'CREATE', 'MERGE'}
+FIRST_CLAUSES = {'CREATE', 'MERGE', 'MATCH'}
+FORBIDDEN_CLAUSES = {'DELETE', 'DETACH', 'REMOVE', 'DROP', 'CALL', 'LOAD'}
+
+class OpenCypherParseError(ValueError):
+    pass
+
+def quote_name(name):
+    """Quote a label or relationship type, which cannot be passed as a query parameter."""
+    return '`' + name.replace('`', '``') + '`'
+
+def node_id(repo, path, symbol):
+    """
+    The stable ID of a node. The same repository, file and symbol always map to the same node,
+    so writing it again updates it instead of adding a duplicate.
+    Args:
+        repo (str): The repository URL.
+        path (str): The file, relative to the repository root, or the module of a symbol.
+        symbol (str): The symbol inside the file, empty for the file itself.
+    """
+    return f"{repo or ''}|{path or ''}|{symbol or ''}"
+
+def properties_node_id(label, properties, repo=None):
+    """The stable ID of a node written by the model: a file by its path, anything else by its path, label and name."""
+    repo = properties.get('repo', repo)
+    if label == 'File':
+        return node_id(repo, properties.get('path') or properties.get('name'), '')
+    return node_id(repo, properties.get('path'), f"{label}:{properties.get('name')}")
+
+def merge_node_query(label):
+    """Upsert one node by its stable ID, with the parameters $id and $properties."""
+    return f"MERGE (n:{quote_name(label)} {{`~id`: $id}}) SET n += $properties RETURN id(n) AS id"
+
+def merge_relationship(statement):
+    """
+    Turn MATCH ... CREATE (a)-[:TYPE]->(b) into MATCH ... MERGE (a)-[:TYPE]->(b), so running it again does not add
+    another relationship. Any other statement is returned as it is.
+    """
+    match = RELATIONSHIP_CREATE_PATTERN.match(statement)
+    if not match:
+        return statement
+    return f"{match.group('match')}MERGE{match.group('pattern')}"
+
+def map_literal_end(text, start):
+    """
+    Find the end of the map literal starting at text[start], the { matched by its }.
+    Returns:
+        end (int): The index after the closing }, None when the map is not closed.
+    """
+    depth = 0
+    position = start
+    while position < len(text):
+        string = STRING_PATTERN.match(text, position)
+        if string:
+            position = string.end()
+            continue
+        if text[position] in '{[':
+            depth += 1
+        elif text[position] in '}]':
+            depth -= 1
+            if depth == 0:
+                return position + 1
+        position += 1
+    return None
+
+def match_node_create(statement):
+    """
+    Split a statement that is exactly one node CREATE into its parts.
+    Returns:
+        (variable, label, properties, returned) with the properties as map literal text, or None when
+        the statement is anything else, i.e. a path or several nodes.
+    """
+    start = NODE_CREATE_START_PATTERN.match(statement)
+    if not start:
+        return None
+    properties = None
+    position = start.end()
+    if statement.startswith('{', position):
+        end = map_literal_end(statement, position)
+        if end is None:
+            return None
+        properties = statement[position:end]
+        position = end
+    end = NODE_CREATE_END_PATTERN.match(statement, position)
+    if not end:
+        return None
+    return start.group('variable'), start.group('label'), properties, end.group('returned')
+
+def tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN_PATTERN.match(text, position)
+        if not match or match.end() == position:
+            raise OpenCypherParseError(f"Unexpected character at {position}: {text[position:position + 20]!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
+
+def unquote(literal):
+    body = literal[1:-1]
+    return re.sub(r'\\(.)', lambda match: ESCAPES.get(match.group(1), match.group(1)), body)
+
+def parse_value(tokens, index):
+    kind, value = tokens[index]
+    if kind == 'string':
+        return unquote(value), index + 1
+    if kind == 'number':
+        return (float(value) if '.' in value else int(value)), index + 1
+    if kind == 'name' and value.lower() in ('true', 'false', 'null'):
+        return {'true': True, 'false': False, 'null': None}[value.lower()], index + 1
+    if value == '[':
+        items = []
+        index += 1
+        while tokens[index][1] != ']':
+            item, index = parse_value(tokens, index)
+            items.append(item)
+            if tokens[index][1] == ',':
+                index += 1
+        return items, index + 1
+    if value == '{':
+        return parse_map(tokens, index)
+    raise OpenCypherParseError(f"Unsupported value {value!r}")
+
+def parse_map(tokens, index):
+    if tokens[index][1] != '{':
+        raise OpenCypherParseError("Expected {")
+    properties = {}
+    index += 1
+    while tokens[index][1] != '}':
+        kind, key = tokens[index]
+        if kind != 'name' or tokens[index + 1][1] != ':':
+            raise OpenCypherParseError(f"Expected a property name, got {key!r}")
+        value, index = parse_value(tokens, index + 2)
+        properties[key.strip('`')] = value
+        if tokens[index][1] == ',':
+            index += 1
+        elif tokens[index][1] != '}':
+            raise OpenCypherParseError(f"Expected , or }} after property {key!r}")
+    return properties, index + 1
+
+def split_statements(text):
+    """
+    Split openCypher text on the semicolons that are not inside a string literal.
+    Args:
+        text (str): One or more statements separated by ;
+    Returns:
+        statements (list): The non-empty statements, stripped.
+    Raises:
+        OpenCypherParseError: When a string literal or a bracket is not closed.
+    """
+    statements = []
+    current = []
+    stack = []
+    quote = None
+    index = 0
+    while index < len(text):
+        char = text[index]
+        if quote:
+            if char == '\\' and quote != '`':
+                current.append(text[index:index + 2])
+                index += 2
+                continue
+            if char == quote:
+                quote = None
+        elif char in '\'"`':
+            quote = char
+        elif char in BRACKETS:
+            stack.append(BRACKETS[char])
+        elif char in BRACKETS.values():
+            if not stack or stack.pop() != char:
+                raise OpenCypherParseError(f"Unbalanced {char!r} at {index}")
+        elif char == ';' and not stack:
+            statements.append(''.join(current))
+            current = []
+            index += 1
+            continue
+        current.append(char)
+        index += 1
+    if quote:
+        raise OpenCypherParseError(f"Unterminated {quote} literal")
+    if stack:
+        raise OpenCypherParseError(f"Missing {stack[-1]!r}")
+    statements.append(''.join(current))
+    return [statement.strip() for statement in statements if statement.strip()]
+
+def validate_statement(statement):
+    """
+    Check a generated statement locally before it is sent to Neptune.
+    It must start with CREATE, MERGE or MATCH, write to the graph, never delete or call procedures,
+    and the property maps of a single node CREATE must parse.
+    Raises:
+        OpenCypherParseError: With the reason the statement is rejected.
+    """
+    # split_statements checks the brackets and string literals of a single statement too
+    if len(split_statements(statement)) != 1:
+        raise OpenCypherParseError("Expected exactly one statement")
+    # Keywords inside string literals and quoted names do not count
+    keywords = {word.upper() for word in re.findall(r'[A-Za-z_]+', STRING_PATTERN.sub("''", statement))}
+    first = re.match(r'\s*(\w+)', statement)
+    if not first or first.group(1).upper() not in FIRST_CLAUSES:
+        raise OpenCypherParseError(f"Statements must start with one of {sorted(FIRST_CLAUSES)}")
+    if not keywords & WRITE_CLAUSES:
+        raise OpenCypherParseError("Statement does not write to the graph")
+    forbidden = keywords & FORBIDDEN_CLAUSES
+    if forbidden:
+        raise OpenCypherParseError(f"Statement uses {sorted(forbidden)}")
+    node = match_node_create(statement)
+    if node and parse_node_create(statement) is None:
+        variable, label, properties, returned = node
+        if properties:
+            # Raises the reason the properties do not parse
+            parse_map_literal(properties)
+        raise OpenCypherParseError("RETURN does not refer to the created node")
+
+def parse_map_literal(text):
+    """
+    Parse an openCypher map literal, i.e. {name: 'File', size: 3}, without sending it to Neptune.
+    Args:
+        text (str): The map literal.
+    Returns:
+        properties (dict): The parsed map.
+    """
+    tokens = tokenize(text)
+    try:
+        properties, index = parse_map(tokens, 0)
+    except IndexError:
+        raise OpenCypherParseError(f"Unterminated map literal {text[:50]!r}")
+    if index != len(tokens):
+        raise OpenCypherParseError(f"Unexpected text after map literal {text[:50]!r}")
+    return properties
+
+def parse_node_create(statement):
+    """
+    Recognize a statement that creates a single node, i.e.
+    CREATE (n:File {name: 'main.py'}) RETURN id(n) as id
+    Args:
+        statement (str): The openCypher statement.
+    Returns:
+        (label, properties) or None when the statement does anything else.
+    """
+    node = match_node_create(statement)
+    if not node:
+        return None
+    variable, label, properties, returned = node
+    if returned and returned != variable:
+        return None
+    try:
+        properties = parse_map_literal(properties) if properties else {}
+    except OpenCypherParseError:
+        return None
+    return label.strip('`'), properties
+
+def parse_pattern_node(statement, position):
+    """
+    Parse one node of a pattern, i.e. (a:Class {name: 'A'}) or (a).
+    Returns:
+        (variable, label, properties, end) or None when there is no node at position.
+    """
+    start = PATTERN_NODE_PATTERN.match(statement, position)
+    if not start:
+        return None
+    properties = {}
+    position = start.end()
+    if statement.startswith('{', position):
+        end = map_literal_end(statement, position)
+        if end is None:
+            return None
+        try:
+            properties = parse_map_literal(statement[position:end])
+        except OpenCypherParseError:
+            return None
+        position = end
+    end = PATTERN_NODE_END_PATTERN.match(statement, position)
+    if not end:
+        return None
+    label = start.group('label').strip('`') if start.group('label') else None
+    return start.group('variable'), label, properties, end.end()
+
+def parse_create_pattern(statement):
+    """
+    Recognize a statement that only creates nodes and relationships between them, i.e.
+    CREATE (a:Class {name: 'A'})-[:DEFINES]->(b:Function {name: 'f'}), (c:File {name: 'main.py'}) RETURN id(a)
+    Args:
+        statement (str): The openCypher statement.
+    Returns:
+        (nodes, relationships) or None when the statement does anything else. nodes is a list of
+        (variable, label, properties) and relationships a list of (from variable, type, to variable).
+        Anonymous nodes get a variable that cannot clash with a name, i.e. #0.
+    """
+    start = re.match(r'\s*CREATE\b', statement, re.IGNORECASE)
+    if not start:
+        return None
+    position = start.end()
+    nodes = {}
+    relationships = []
+    while True:
+        # The node and relationship the next node of the path is linked from
+        previous = pending = None
+        while True:
+            node = parse_pattern_node(statement, position)
+            if node is None:
+                return None
+            variable, label, properties, position = node
+            variable = variable or f"#{len(nodes)}"
+            if label:
+                if variable in nodes:
+                    return None
+                nodes[variable] = (label, properties)
+            elif variable not in nodes or properties:
+                # Only a node created earlier in the statement can be referred to without a label
+                return None
+            if pending:
+                relationship_type, reverse = pending
+                relationships.append((variable, relationship_type, previous) if reverse else (previous, relationship_type, variable))
+            relationship = PATTERN_RELATIONSHIP_PATTERN.match(statement, position)
+            if not relationship:
+                break
+            if bool(relationship.group('left')) == bool(relationship.group('right')):
+                # Relationships are always stored with a direction
+                return None
+            pending = (relationship.group('type').strip('`'), bool(relationship.group('left')))
+            previous = variable
+            position = relationship.end()
+        separator = re.match(r'\s*,', statement[position:])
+        if not separator:
+            break
+        position += separator.end()
+    if not PATTERN_END_PATTERN.match(statement, position):
+        return None
+    return [(variable, label, properties) for variable, (label, properties) in nodes.items()], relationships
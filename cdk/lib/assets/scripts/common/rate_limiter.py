@@ -0,0 +1,138 @@
+import random
+import threading
+import time
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'Throttling',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+    'ProvisionedThroughputExceededException',
+    # Error events of a Bedrock response stream
+    'throttlingException',
+}
+TRANSIENT_ERROR_CODES = {
+    'ServiceUnavailableException',
+    'ServiceUnavailable',
+    'InternalServerException',
+    'InternalFailure',
+    'ModelTimeoutException',
+    'ModelNotReadyException',
+    'ConflictException',
+    'internalServerException',
+    'modelStreamErrorException',
+    'modelTimeoutException',
+    'serviceUnavailableException',
+}
+
+def error_code(e):
+    if isinstance(e, ClientError):
+        return e.response.get('Error', {}).get('Code')
+    return None
+
+def is_throttling_error(e):
+    return error_code(e) in THROTTLING_ERROR_CODES
+
+def is_transient_error(e):
+    # Connection resets and read timeouts carry no error code
+    return error_code(e) in TRANSIENT_ERROR_CODES or isinstance(e, (BotocoreConnectionError, HTTPClientError))
+
+def is_retryable_error(e):
+    """
+    Tell throttling and transient errors apart from permanent ones.
+    Args:
+        e (Exception): The error raised by a call.
+    Returns:
+        bool: True if the same call may succeed when it is sent again.
+    """
+    return is_throttling_error(e) or is_transient_error(e)
+
+class AdaptiveRateLimiter:
+    """A class to keep the requests to one service at its quota without overshooting it.
+
+    Requests wait for a token from a token bucket. The bucket rate is adjusted with
+    AIMD: it grows additively after every success and is halved on every throttling error.
+    """
+
+    def __init__(self, name, max_rate, max_concurrency, min_rate=0.1, max_attempts=6, base_delay=1.0, max_delay=60.0):
+        """Initialize AdaptiveRateLimiter for one service.
+
+        Args:
+            name (str): The service name, used in log messages.
+            max_rate (float): The highest number of requests per second.
+            max_concurrency (int): The highest number of requests in flight.
+            min_rate (float): The rate is never lowered below this value.
+            max_attempts (int): Number of attempts for throttling and transient errors.
+            base_delay (float): Upper bound in seconds of the first backoff.
+            max_delay (float): Upper bound in seconds of any backoff.
+        """
+        self.name = name
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate = max_rate
+        self.increase = max_rate / 20
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.lock = threading.Lock()
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.throttles = 0
+        self.retries = 0
+
+    def acquire(self):
+        """Block until the bucket holds a token."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+            self.throttles += 1
+
+    def call(self, function, *args, **kwargs):
+        """
+        Call a client method within the rate limit.
+        Throttling and transient errors are retried with exponential backoff and full jitter,
+        permanent errors are raised right away.
+        Args:
+            function: The client method, i.e. bedrock.invoke_model.
+            *args, **kwargs: The arguments of the method.
+        Returns:
+            The response of the method.
+        """
+        for attempt in range(self.max_attempts):
+            self.acquire()
+            try:
+                with self.semaphore:
+                    response = function(*args, **kwargs)
+            except Exception as e:
+                if is_throttling_error(e):
+                    self.on_throttle()
+                elif not is_transient_error(e):
+                    raise
+                if attempt == self.max_attempts - 1:
+                    raise
+                with self.lock:
+                    self.retries += 1
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                print(f"{self.name} request failed with {error_code(e) or type(e).__name__}, retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            self.on_success()
+            return response
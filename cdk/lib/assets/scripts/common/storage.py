@@ -0,0 +1,48 @@
+import os
+from aws_clients import get_client
+
+def split_s3_location(location):
+    """Split an s3://bucket/key URI into its bucket and key."""
+    bucket, _, key = location[len('s3://'):].partition('/')
+    return bucket, key
+
+def read(location):
+    """
+    Read a file from a local path or an s3://bucket/key URI.
+    Returns:
+        body (bytes): The content of the file, None when it does not exist.
+    """
+    if location.startswith('s3://'):
+        bucket, key = split_s3_location(location)
+        s3 = get_client('s3')
+        try:
+            return s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+        except s3.exceptions.NoSuchKey:
+            return None
+    if not os.path.exists(location):
+        return None
+    with open(location, 'rb') as f:
+        return f.read()
+
+def write(location, body):
+    """Write a file to a local path, creating its directory, or to an s3://bucket/key URI."""
+    if location.startswith('s3://'):
+        bucket, key = split_s3_location(location)
+        get_client('s3').put_object(Bucket=bucket, Key=key, Body=body)
+        return
+    directory = os.path.dirname(location)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    # Replace the file at once, a job killed while writing keeps the previous content
+    tmp_path = f"{location}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, location)
+
+def delete(location):
+    """Delete a file from a local path or an s3://bucket/key URI, if it exists."""
+    if location.startswith('s3://'):
+        bucket, key = split_s3_location(location)
+        get_client('s3').delete_object(Bucket=bucket, Key=key)
+    elif os.path.exists(location):
+        os.remove(location)
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import git
+from aws_clients import register_client
+from fake_backends import FakeBedrock, FakeAmazonQ, FakeNeptuneGraph
+
+# Tuning variables copied into the report, so runs with different settings can be compared
+SETTINGS = [
+    'MAX_WORKERS', 'BEDROCK_CONCURRENCY', 'BEDROCK_MAX_RATE', 'Q_CONCURRENCY', 'Q_MAX_RATE',
+    'NEPTUNE_CONCURRENCY', 'NEPTUNE_MAX_RATE', 'MAX_CHUNK_TOKENS', 'AWS_MAX_POOL_CONNECTIONS', 'PROMPT_MODE',
+    'BEDROCK_STREAMING', 'BEDROCK_PROMPT_CACHING', 'EMBEDDING_CONCURRENCY', 'EMBEDDING_MAX_RATE', 'GRAPH_EMBEDDED_LABELS',
+]
+
+def synthetic_repository(directory, files, file_bytes):
+    """
+    Create a git repository of Python modules that import and call each other.
+    Args:
+        directory (str): The folder of the repository.
+        files (int): Number of modules.
+        file_bytes (int): Approximate size of every module.
+    Returns:
+        directory (str): The folder of the repository.
+    """
+    repo = git.Repo.init(directory)
+    for i in range(files):
+        package = os.path.join(directory, f"package_{i // 50}")
+        os.makedirs(package, exist_ok=True)
+        lines = [f"from package_{(i - 1) // 50}.module_{i - 1} import function_0 as previous" if i else "previous = abs", ""]
+        j = 0
+        while sum(len(line) + 1 for line in lines) < file_bytes:
+            lines += [f"def function_{j}(value):", f"    return previous(value) + {j}", ""]
+            j += 1
+        with open(os.path.join(package, f"module_{i}.py"), 'w') as f:
+            f.write('\n'.join(lines))
+    repo.git.add('-A')
+    repo.index.commit('Synthetic repository')
+    return directory
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Run process_repository against fake Bedrock, Q Business and Neptune backends.")
+    parser.add_argument('--repository', help="A local git repository, a synthetic one is generated otherwise.")
+    parser.add_argument('--files', type=int, default=100, help="Number of files of the synthetic repository.")
+    parser.add_argument('--file-bytes', type=int, default=4000, help="Size of the files of the synthetic repository.")
+    parser.add_argument('--graph', choices=['none', 'static', 'llm'], default='none', help="Graph extractor to run.")
+    parser.add_argument('--bedrock-latency', type=float, default=0.5, help="Mean seconds of a Bedrock request.")
+    parser.add_argument('--bedrock-rate', type=float, help="Bedrock requests per second before throttling.")
+    parser.add_argument('--q-latency', type=float, default=0.1, help="Mean seconds of a Q Business request.")
+    parser.add_argument('--q-rate', type=float, help="Q Business requests per second before throttling.")
+    parser.add_argument('--neptune-latency', type=float, default=0.02, help="Mean seconds of a Neptune query.")
+    parser.add_argument('--neptune-rate', type=float, help="Neptune queries per second before throttling.")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="Probability of a transient failure per request.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the injected failures and latency jitter.")
+    parser.add_argument('--output', help="Also write the report to this JSON file.")
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    work_directory = tempfile.mkdtemp(prefix='ingestion-benchmark-')
+    repository = os.path.abspath(args.repository) if args.repository else synthetic_repository(
+        os.path.join(work_directory, 'source'), args.files, args.file_bytes
+    )
+    # Imports resolve from the script and ../common after the move to the work directory
+    sys.path = [os.path.abspath(path) for path in sys.path]
+    os.chdir(work_directory)
+    # Caches, manifest and checkpoint start empty, so every file is processed.
+    # Concurrency and rate limits are read from the environment as in a job, i.e. MAX_WORKERS=16.
+    os.environ.update({
+        'REPO_URL': f"file://{repository}",
+        'LLM_CACHE_LOCATION': os.path.join(work_directory, 'llm_cache.sqlite'),
+        'EMBEDDING_CACHE_DIRECTORY': os.path.join(work_directory, 'embedding_cache/'),
+        'MANIFEST_LOCATION': os.path.join(work_directory, 'manifest.json'),
+        'CHECKPOINT_LOCATION': os.path.join(work_directory, 'checkpoint.json'),
+        'ENABLE_GRAPH': 'false' if args.graph == 'none' else 'true',
+        'GRAPH_EXTRACTOR': 'static' if args.graph == 'none' else args.graph,
+        'NEPTUNE_GRAPH_ID': 'benchmark',
+    })
+    for variable in ('AMAZON_Q_APP_ID', 'Q_APP_INDEX', 'Q_APP_ROLE_ARN', 'Q_APP_DATA_SOURCE_ID'):
+        os.environ.setdefault(variable, 'benchmark')
+    services = {
+        'bedrock-runtime': FakeBedrock(latency=args.bedrock_latency, max_rate=args.bedrock_rate, failure_rate=args.failure_rate, seed=args.seed),
+        'qbusiness': FakeAmazonQ(latency=args.q_latency, max_rate=args.q_rate, failure_rate=args.failure_rate, seed=args.seed),
+        'neptune-graph': FakeNeptuneGraph(latency=args.neptune_latency, max_rate=args.neptune_rate, failure_rate=args.failure_rate, seed=args.seed),
+    }
+    for service_name, service in services.items():
+        register_client(service_name, service)
+    # Imported once the fake clients are registered, the script creates its clients at import time
+    import generate_documentation_and_ingest_code as ingestion
+
+    started = time.perf_counter()
+    processed_files, failed_files = ingestion.process_repository(os.environ['REPO_URL'])
+    seconds = time.perf_counter() - started
+    if ingestion.prompt_mode == 'compare':
+        # Saved to PROMPT_COMPARISON_LOCATION, the work directory by default
+        ingestion.save_prompt_comparison()
+    files = len(processed_files) + len(failed_files)
+    api_calls = {service.name: dict(service.calls) for service in services.values()}
+    total_calls = sum(sum(calls.values()) for calls in api_calls.values())
+    report = {
+        'files': files,
+        'failed_files': len(failed_files),
+        'seconds': round(seconds, 3),
+        'files_per_second': round(files / seconds, 3) if seconds else None,
+        'api_calls': api_calls,
+        'api_calls_per_file': round(total_calls / files, 2) if files else None,
+        'throttled': {service.name: service.throttled for service in services.values()},
+        'injected_failures': {service.name: service.failed for service in services.values()},
+        # ru_maxrss is in kilobytes on Linux
+        'peak_memory_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'settings': {variable: os.environ[variable] for variable in SETTINGS if variable in os.environ},
+        **ingestion.metrics.summary(),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import json
+import time
+import storage
+
+def empty_checkpoint(repo_url):
+    return {'repo_url': repo_url, 'sync_job_id': None, 'stages': [], 'files': {}}
+
+class Checkpoint:
+    """A class to record the files and stages a run finished, outside the container,
+    so a job restarted after a spot reclamation or a timeout resumes where it stopped."""
+
+    def __init__(self, location, repo_url, interval=60):
+        """Initialize Checkpoint and load the progress of the interrupted run, if any.
+
+        Args:
+            location (str): A local path or an s3://bucket/key URI.
+            repo_url (str): The repository the checkpoint belongs to.
+            interval (int): Minimum number of seconds between two saves.
+        """
+        self.location = location
+        self.interval = interval
+        self.last_save = time.time()
+        self.state = self._load(repo_url)
+
+    def _load(self, repo_url):
+        body = storage.read(self.location)
+        if body is None:
+            return empty_checkpoint(repo_url)
+        state = json.loads(body)
+        if state.get('repo_url') != repo_url:
+            print(f"Checkpoint at {self.location} belongs to {state.get('repo_url')}, ignoring it")
+            return empty_checkpoint(repo_url)
+        print(f"Resuming from checkpoint: {len(state['files'])} files and stages {state['stages']} finished")
+        return state
+
+    @property
+    def sync_job_id(self):
+        return self.state['sync_job_id']
+
+    def set_sync_job_id(self, sync_job_id):
+        # Saved right away, a restarted job keeps uploading to the same sync job
+        self.state['sync_job_id'] = sync_job_id
+        self.save()
+
+    def finished_file(self, path, blob):
+        """
+        Returns:
+            entry (dict): The document IDs and finished stages of the file, or None when
+            the file was not processed or changed since.
+        """
+        entry = self.state['files'].get(path)
+        if entry is None or entry['blob'] != blob:
+            return None
+        return entry
+
+    def finish_file(self, path, blob, document_ids, stages):
+        self.state['files'][path] = {'blob': blob, 'documents': document_ids, 'stages': stages}
+
+    def finished_stage(self, stage):
+        return stage in self.state['stages']
+
+    def finish_stage(self, stage):
+        self.state['stages'].append(stage)
+        self.save()
+
+    def due(self):
+        return time.time() - self.last_save >= self.interval
+
+    def save(self):
+        """Persist the progress. Documents of the finished files must be uploaded before."""
+        # A job killed while saving keeps the previous checkpoint
+        storage.write(self.location, json.dumps(self.state).encode('utf-8'))
+        self.last_save = time.time()
+
+    def clear(self):
+        """Delete the checkpoint once the run completed, the next run starts from the manifest."""
+        storage.delete(self.location)
@@ -0,0 +1,108 @@
+import ast
+
+# Code averages about three characters per token, so this errs on the side of smaller chunks
+CHARS_PER_TOKEN = 3
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class Chunk:
+    """A class to hold a part of a file and the lines it spans."""
+
+    def __init__(self, text, start_line, end_line):
+        """Initialize Chunk.
+
+        Args:
+            text (str): The text of the chunk.
+            start_line (int): The first line of the chunk, starting at 1.
+            end_line (int): The last line of the chunk.
+        """
+        self.text = text
+        self.start_line = start_line
+        self.end_line = end_line
+
+def python_boundaries(code_text):
+    """
+    Find the lines where top-level statements, i.e. functions and classes, start.
+    Returns:
+        list: The 0-based start line of every top-level statement, or None if the code does not parse.
+    """
+    try:
+        tree = ast.parse(code_text)
+    except (SyntaxError, ValueError):
+        return None
+    boundaries = []
+    for node in tree.body:
+        # Decorators belong to the function or class below them
+        decorators = getattr(node, 'decorator_list', [])
+        start = min([node.lineno] + [decorator.lineno for decorator in decorators])
+        boundaries.append(start - 1)
+    return boundaries
+
+def line_windows(lines, start, end, max_chars):
+    """
+    Split lines[start:end] into windows of at most max_chars, breaking between lines.
+    A line longer than max_chars, i.e. minified code or a data file on one line, is split into windows of characters.
+    Returns:
+        windows (list): (start, end, text) of every window, text is None for a window of whole lines.
+    """
+    windows = []
+    window_start = start
+    size = 0
+    for index in range(start, end):
+        if size and size + len(lines[index]) > max_chars:
+            windows.append((window_start, index, None))
+            window_start = index
+            size = 0
+        if len(lines[index]) > max_chars:
+            line = lines[index]
+            windows.extend((index, index + 1, line[offset:offset + max_chars]) for offset in range(0, len(line), max_chars))
+            window_start = index + 1
+            continue
+        size += len(lines[index])
+    if window_start < end:
+        windows.append((window_start, end, None))
+    return windows
+
+def chunk_code(code_text, file_path, max_tokens):
+    """
+    Split a file that is too large for one prompt on syntactic boundaries.
+    Python files are split between top-level functions and classes, other files
+    (and Python files that do not parse) in windows of lines.
+    Args:
+        code_text (str): The content of the file.
+        file_path (str): The path of the file, used to pick the parser.
+        max_tokens (int): The estimated token budget of a chunk.
+    Returns:
+        chunks (list): The chunks, a single one when the file fits the budget.
+    """
+    lines = code_text.splitlines(keepends=True)
+    if estimate_tokens(code_text) <= max_tokens:
+        return [Chunk(code_text, 1, max(len(lines), 1))]
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    boundaries = python_boundaries(code_text) if file_path.endswith('.py') else None
+    if boundaries:
+        # Sections run from one top-level statement to the next, the first one includes the module header
+        starts = [0] + [boundary for boundary in boundaries if boundary > 0]
+        sections = list(zip(starts, starts[1:] + [len(lines)]))
+    else:
+        sections = [(0, len(lines))]
+    # Pack whole sections into chunks and only split a section that is too large by itself
+    spans = []
+    span_chars = 0
+    for start, end in sections:
+        section_chars = sum(len(line) for line in lines[start:end])
+        if section_chars > max_chars:
+            spans.extend(line_windows(lines, start, end, max_chars))
+            # Never append to a window, it may already be full
+            span_chars = max_chars
+        elif spans and span_chars + section_chars <= max_chars:
+            spans[-1] = (spans[-1][0], end, None)
+            span_chars += section_chars
+        else:
+            spans.append((start, end, None))
+            span_chars = section_chars
+    return [
+        Chunk(text if text is not None else ''.join(lines[start:end]), start + 1, end)
+        for start, end, text in spans
+    ]
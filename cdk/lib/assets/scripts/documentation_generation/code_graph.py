@@ -0,0 +1,234 @@
+import ast
+import os
+from opencypher_parser import node_id
+
+# Labels of the nodes given a vector by default. Functions are the bulk of the nodes and are found through their module or class.
+EMBEDDED_LABELS = ('File', 'Module', 'Class')
+
+class CodeGraph:
+    """A class to collect the nodes and edges extracted from the files of a repository.
+    Nodes are keyed by (path, symbol): a file by its path and an empty symbol, a module by
+    its dotted name, and a class or function by its module and its name inside the module."""
+
+    def __init__(self):
+        """Initialize an empty CodeGraph."""
+        # Nodes by key and edges in the order they were found
+        self.nodes = {}
+        self.edges = []
+
+    def add_node(self, label, key, **properties):
+        self.nodes[key] = (label, properties)
+
+    def add_edge(self, from_key, relationship, to_key):
+        self.edges.append((from_key, relationship, to_key))
+
+    def resolved_edges(self):
+        """
+        Returns:
+            edges (list): The unique (from key, relationship, to key) edges. Targets may be outside the graph,
+            i.e. a function of a file that did not change, the edge is then only written if the node exists.
+        """
+        return list(dict.fromkeys(edge for edge in self.edges if edge[0] != edge[2]))
+
+def module_name(path):
+    """Turn a path relative to the repository root into a dotted module name, i.e. pkg/mod.py to pkg.mod."""
+    parts = os.path.splitext(path)[0].replace(os.sep, '/').split('/')
+    if parts[-1] == '__init__' and len(parts) > 1:
+        parts = parts[:-1]
+    return '.'.join(parts)
+
+def first_line(docstring):
+    return docstring.strip().splitlines()[0] if docstring and docstring.strip() else ''
+
+class PythonVisitor(ast.NodeVisitor):
+    """Walk a Python module and add its classes, functions, imports and calls to a CodeGraph."""
+
+    def __init__(self, graph, path, module):
+        self.graph = graph
+        self.path = path
+        self.module = module
+        self.is_package = os.path.basename(path) == '__init__.py'
+        # Local names bound by imports and top-level definitions to node keys
+        self.aliases = {}
+        self.scopes = [(module, '')]
+        self.classes = []
+
+    def child(self, name):
+        parent = self.scopes[-1][1]
+        return (self.module, f"{parent}.{name}" if parent else name)
+
+    def add_definition(self, label, node, **properties):
+        key = self.child(node.name)
+        self.graph.add_node(
+            label, key, name=f"{self.module}.{key[1]}", path=self.path, line=node.lineno,
+            docstring=first_line(ast.get_docstring(node)), **properties
+        )
+        self.graph.add_edge(self.scopes[-1], 'DEFINES', key)
+        return key
+
+    def resolve_module(self, name, level):
+        if not level:
+            return name
+        package = self.module.split('.')
+        # A relative import in a package's __init__ starts from the package itself
+        package = package[:len(package) - level + (1 if self.is_package else 0)]
+        return '.'.join(package + ([name] if name else []))
+
+    def visit_Module(self, node):
+        # Bind the top-level names first, so calls to functions defined further down resolve
+        for statement in node.body:
+            if isinstance(statement, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.aliases[statement.name] = (self.module, statement.name)
+        self.generic_visit(node)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            self.graph.add_edge((self.module, ''), 'IMPORTS', (alias.name, ''))
+            # import a.b binds a, import a.b as c binds c to a.b
+            if alias.asname:
+                self.aliases[alias.asname] = (alias.name, '')
+            else:
+                self.aliases[alias.name.split('.')[0]] = (alias.name.split('.')[0], '')
+
+    def visit_ImportFrom(self, node):
+        imported = self.resolve_module(node.module, node.level)
+        if not imported:
+            return
+        self.graph.add_edge((self.module, ''), 'IMPORTS', (imported, ''))
+        for alias in node.names:
+            if alias.name != '*':
+                self.aliases[alias.asname or alias.name] = (imported, alias.name)
+
+    def visit_ClassDef(self, node):
+        key = self.add_definition('Class', node, bases=[ast.unparse(base) for base in node.bases])
+        self.scopes.append(key)
+        self.classes.append(key)
+        self.generic_visit(node)
+        self.classes.pop()
+        self.scopes.pop()
+
+    def visit_FunctionDef(self, node):
+        key = self.add_definition('Function', node, signature=f"{node.name}({ast.unparse(node.args)})")
+        self.scopes.append(key)
+        self.generic_visit(node)
+        self.scopes.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        target = self.resolve_call(node.func)
+        if target:
+            self.graph.add_edge(self.scopes[-1], 'CALLS', target)
+        self.generic_visit(node)
+
+    def resolve_call(self, func):
+        # f() and alias.f() are resolved through the imports and definitions of the module,
+        # self.f() to the method of the enclosing class. Anything else is not followed.
+        if isinstance(func, ast.Name):
+            return self.aliases.get(func.id)
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            if func.value.id in ('self', 'cls') and self.classes:
+                module, symbol = self.classes[-1]
+            elif func.value.id in self.aliases:
+                module, symbol = self.aliases[func.value.id]
+            else:
+                return None
+            return (module, f"{symbol}.{func.attr}" if symbol else func.attr)
+        return None
+
+def extract_python(graph, path, module, code_text):
+    visitor = PythonVisitor(graph, path, module)
+    visitor.visit(ast.parse(code_text))
+
+# Extractors by file extension. Files without one only get a File node.
+EXTRACTORS = {
+    '.py': extract_python,
+}
+
+def register_extractor(extensions, extractor):
+    """
+    Add support for another language.
+    Args:
+        extensions (list): The file extensions handled by the extractor, i.e. ['.js', '.ts'].
+        extractor (function): Called with (graph, path, module, code_text), adds the nodes and edges of the file.
+    """
+    for extension in extensions:
+        EXTRACTORS[extension] = extractor
+
+def extract_file(graph, root, file_path):
+    """
+    Add the File node of a file and, when its language is supported, its Module, Class and Function nodes.
+    Args:
+        graph (CodeGraph): The graph to add to.
+        root (str): The repository working tree.
+        file_path (str): The file, inside root.
+    """
+    path = os.path.relpath(file_path, root).replace(os.sep, '/')
+    graph.add_node('File', (path, ''), name=path, path=path)
+    extractor = EXTRACTORS.get(os.path.splitext(path)[1])
+    if extractor is None:
+        return
+    try:
+        with open(file_path, 'r') as f:
+            code_text = f.read()
+    except UnicodeDecodeError as e:
+        # Binary detection only reads the start of a file, one undecodable file does not fail the whole graph
+        print(f"Could not read {path}: {e}")
+        return
+    module = module_name(path)
+    graph.add_node('Module', (module, ''), name=module, path=path)
+    graph.add_edge((path, ''), 'CONTAINS', (module, ''))
+    try:
+        extractor(graph, path, module, code_text)
+    except (SyntaxError, ValueError) as e:
+        print(f"Could not extract the graph of {path}: {e}")
+
+def embedding_text(label, properties):
+    """Describe a node in one line, the text its vector is generated from."""
+    text = f"{label} {properties['name']}"
+    if 'signature' in properties:
+        text += f" {properties['signature']}"
+    if properties.get('path') and properties['path'] != properties['name']:
+        text += f" in {properties['path']}"
+    if properties.get('docstring'):
+        text += f": {properties['docstring']}"
+    return text
+
+def build_graph(root, file_paths):
+    """
+    Extract the graph of the given files without calling a model.
+    Args:
+        root (str): The repository working tree.
+        file_paths (list): The files to extract.
+    Returns:
+        graph (CodeGraph): The extracted graph.
+    """
+    graph = CodeGraph()
+    for file_path in file_paths:
+        extract_file(graph, root, file_path)
+    return graph
+
+def write_graph(graph, graph_writer, repo, embedded_labels=EMBEDDED_LABELS):
+    """
+    Queue the nodes and edges of a CodeGraph on a GraphWriter, or a GraphExporter, and write them.
+    Args:
+        graph (CodeGraph): The extracted graph.
+        graph_writer (GraphWriter): Where the graph is written.
+        repo (str): The repository URL, part of every node ID and stored on every node. The file property of every
+        node is the file it was extracted from, the one it is pruned with.
+        embedded_labels (tuple): Labels of the nodes an embedding is generated for.
+    Returns:
+        (int, int): The number of nodes and edges written.
+    """
+    for key, (label, properties) in graph.nodes.items():
+        properties = dict(properties, repo=repo, file=properties['path'])
+        text = embedding_text(label, properties) if label in embedded_labels else None
+        graph_writer.add_node(node_id(repo, *key), label, properties, embedding_text=text)
+    edges = graph.resolved_edges()
+    for from_key, relationship, to_key in edges:
+        graph_writer.add_edge(node_id(repo, *from_key), relationship, node_id(repo, *to_key))
+    graph_writer.flush()
+    return len(graph.nodes), len(edges)
+
+def graph_node_ids(graph, repo):
+    return [node_id(repo, *key) for key in graph.nodes]
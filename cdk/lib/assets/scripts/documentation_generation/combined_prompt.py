@@ -0,0 +1,39 @@
+import re
+from graph_output import extract_tag
+
+def combined_instructions(prompts, sections):
+    """
+    Ask for the answers of several prompts in one completion, each between the tags of its section.
+    Args:
+        prompts (list): The prompts, answered in this order.
+        sections (list): The tag name of every prompt, i.e. documentation.
+    Returns:
+        str: The instructions, formatted with the file like a single prompt.
+    """
+    tasks = '\n'.join(f"<{section}> task: {prompt}" for section, prompt in zip(sections, prompts))
+    return (
+        "Complete each of the following tasks about the attached file. "
+        "Write the answer of every task between the tags of its section, i.e. <documentation> and </documentation>, "
+        "in the order of the tasks and without anything outside of the tags. Answer every task as thoroughly as if it was asked alone.\n"
+        f"{tasks}"
+    )
+
+def split_sections(output, sections):
+    """
+    Split a combined completion into the answer of every section.
+    Returns:
+        answers (dict): The stripped text of every section, None for a section missing from the output.
+    """
+    answers = {}
+    for section in sections:
+        answer = extract_tag(output, section)
+        answers[section] = answer.strip() if answer is not None else None
+    return answers
+
+def word_overlap(first, second):
+    """Jaccard similarity of the words of two answers, a rough check that they cover the same ground."""
+    first_words = set(re.findall(r'\w+', first.lower()))
+    second_words = set(re.findall(r'\w+', second.lower()))
+    if not first_words and not second_words:
+        return 1.0
+    return len(first_words & second_words) / len(first_words | second_words)
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import threading
+import time
+from rate_limiter import is_retryable_error
+
+# Limits of the Amazon Q Business BatchPutDocument API
+MAX_DOCUMENTS_PER_BATCH = 10
+MAX_BATCH_PAYLOAD_BYTES = 10 * 1024 * 1024
+MAX_ATTEMPTS = 3
+
+def document_id(source_uri, prompt):
+    """
+    Derive a stable document ID so a re-run overwrites the documents of a file instead of duplicating them.
+    Args:
+        source_uri (str): The URI of the file the document was generated from.
+        prompt (str): The prompt used to generate the document, empty for the file content.
+    Returns:
+        str: The document ID.
+    """
+    return hashlib.sha256(f"{source_uri}|{prompt}".encode('utf-8')).hexdigest()
+
+def document_size(document):
+    """
+    Approximate the number of bytes a document adds to a BatchPutDocument request.
+    Args:
+        document (dict): The document as passed to batch_put_document.
+    Returns:
+        int: The size of the document content plus its metadata.
+    """
+    metadata = {key: value for key, value in document.items() if key != 'content'}
+    return len(document['content']['blob']) + len(json.dumps(metadata))
+
+class DocumentWriter:
+    """A class to buffer documents and upload them to Amazon Q Business in full batches."""
+
+    def __init__(self, amazon_q, application_id, index_id, role_arn, limiter=None, metrics=None):
+        """Initialize DocumentWriter for the given Amazon Q Business index.
+
+        Args:
+            amazon_q: The qbusiness client used to upload documents.
+            application_id (str): The Amazon Q Business application ID.
+            index_id (str): The index the documents are written to.
+            role_arn (str): The role Amazon Q Business assumes to read the documents.
+            limiter (AdaptiveRateLimiter): Optional rate limiter the requests go through.
+            metrics (Metrics): Optional, records the duration and size of every upload.
+        """
+        self.amazon_q = amazon_q
+        self.application_id = application_id
+        self.index_id = index_id
+        self.role_arn = role_arn
+        self.limiter = limiter
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        # Notified whenever a batch taken from the buffer finished uploading
+        self.uploaded = threading.Condition(self.lock)
+        self.in_flight = 0
+        self.documents = []
+        self.payload_bytes = 0
+        self.put_calls = 0
+        self.failed_documents = []
+        self.failed_ids = set()
+
+    def add(self, document):
+        """Buffer a document and upload the buffer once it holds a full batch."""
+        size = document_size(document)
+        batches = []
+        with self.lock:
+            if self.documents and self.payload_bytes + size > MAX_BATCH_PAYLOAD_BYTES:
+                batches.append(self._take_batch())
+            self.documents.append(document)
+            self.payload_bytes += size
+            if len(self.documents) >= MAX_DOCUMENTS_PER_BATCH:
+                batches.append(self._take_batch())
+            self.in_flight += len(batches)
+        for batch in batches:
+            self._put_in_flight(batch)
+
+    def flush(self):
+        """
+        Upload every buffered document and wait for the batches other threads are still uploading,
+        so every document added before is uploaded, or failed, when it returns. Must be called before the sync job is stopped.
+        """
+        with self.lock:
+            batch = self._take_batch()
+            if batch:
+                self.in_flight += 1
+        if batch:
+            self._put_in_flight(batch)
+        with self.uploaded:
+            self.uploaded.wait_for(lambda: self.in_flight == 0)
+
+    def failed(self, document_ids):
+        """Return True when one of the documents was given up on, only known once the documents were flushed."""
+        with self.lock:
+            return not self.failed_ids.isdisjoint(document_ids)
+
+    def delete(self, document_ids, sync_job_id=None):
+        """Delete documents from the index in batches."""
+        document_ids = list(document_ids)
+        for start in range(0, len(document_ids), MAX_DOCUMENTS_PER_BATCH):
+            documents = [{'documentId': _id} for _id in document_ids[start:start + MAX_DOCUMENTS_PER_BATCH]]
+            kwargs = {'dataSourceSyncId': sync_job_id} if sync_job_id else {}
+            response = self._call(
+                self.amazon_q.batch_delete_document,
+                applicationId=self.application_id,
+                indexId=self.index_id,
+                documents=documents,
+                **kwargs
+            )
+            for failed_document in response.get('failedDocuments', []):
+                print(f"Failed to delete document {failed_document['id']}: {failed_document.get('error', {}).get('errorMessage')}")
+
+    def _put_in_flight(self, documents):
+        try:
+            self._put(documents)
+        finally:
+            with self.uploaded:
+                self.in_flight -= 1
+                self.uploaded.notify_all()
+
+    def _take_batch(self):
+        batch = self.documents
+        self.documents = []
+        self.payload_bytes = 0
+        return batch
+
+    def _batch_put_document(self, documents):
+        with self.lock:
+            self.put_calls += 1
+        start = time.perf_counter()
+        response = self._call(
+            self.amazon_q.batch_put_document,
+            applicationId=self.application_id,
+            indexId=self.index_id,
+            roleArn=self.role_arn,
+            documents=documents
+        )
+        if self.metrics:
+            self.metrics.record('upload', time.perf_counter() - start)
+            self.metrics.increment('upload_bytes_sent', sum(document_size(document) for document in documents))
+        return response
+
+    def _call(self, function, **kwargs):
+        if self.limiter is None:
+            return function(**kwargs)
+        return self.limiter.call(function, **kwargs)
+
+    def _put(self, documents):
+        # Only the documents reported in failedDocuments are sent again
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                response = self._batch_put_document(documents)
+            except Exception as e:
+                print(f"Error uploading {len(documents)} documents: {e}")
+                if not is_retryable_error(e):
+                    break
+            else:
+                failed_ids = set()
+                for failed_document in response.get('failedDocuments', []):
+                    print(f"Failed to upload document {failed_document['id']}: {failed_document.get('error', {}).get('errorMessage')}")
+                    failed_ids.add(failed_document['id'])
+                documents = [document for document in documents if document['id'] in failed_ids]
+                if not documents:
+                    return
+            if self.metrics:
+                self.metrics.increment('upload_retries')
+            time.sleep(2 ** attempt)
+        with self.lock:
+            self.failed_documents.extend(document['title'] for document in documents)
+            self.failed_ids.update(document['id'] for document in documents)
@@ -0,0 +1,200 @@
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from botocore.exceptions import ClientError
+from collections import Counter
+
+class FakeService:
+    """A class to stand in for one AWS service client with a latency, a request quota and injected failures.
+    Subclasses implement the client methods the ingestion calls."""
+
+    def __init__(self, name, latency=0.0, max_rate=None, failure_rate=0.0, seed=None):
+        """Initialize FakeService.
+
+        Args:
+            name (str): The service name, used in the error messages.
+            latency (float): Mean seconds a request takes, with +/-25% jitter.
+            max_rate (float): Requests per second above which requests fail with ThrottlingException, None for no quota.
+            failure_rate (float): Probability of a transient ServiceUnavailableException per request.
+            seed (int): Optional seed of the random failures and jitter.
+        """
+        self.name = name
+        self.latency = latency
+        self.max_rate = max_rate
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.throttled = 0
+        self.failed = 0
+        self.tokens = max_rate or 0.0
+        self.last_refill = time.monotonic()
+
+    def request(self, operation, wait=True):
+        """
+        Count the request, then throttle it, fail it or wait for its latency like the service would.
+        Returns:
+            delay (float): The latency of the request, not waited for when wait is False.
+        """
+        with self.lock:
+            self.calls[operation] += 1
+            if self.max_rate:
+                # Token bucket holding one second of requests
+                now = time.monotonic()
+                self.tokens = min(self.max_rate, self.tokens + (now - self.last_refill) * self.max_rate)
+                self.last_refill = now
+                if self.tokens < 1:
+                    self.throttled += 1
+                    raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': f"{self.name} rate exceeded"}}, operation)
+                self.tokens -= 1
+            if self.random.random() < self.failure_rate:
+                self.failed += 1
+                raise ClientError({'Error': {'Code': 'ServiceUnavailableException', 'Message': f"{self.name} injected failure"}}, operation)
+            delay = self.latency * self.random.uniform(0.75, 1.25)
+        if wait:
+            time.sleep(delay)
+        return delay
+
+class FakeBedrock(FakeService):
+    """A class to stand in for the bedrock-runtime client. Completions echo the prompt size,
+    graph prompts get one valid CREATE command, combined prompts every tagged section and embeddings are derived from the text.
+    Blocks marked with cache_control are cached like the prompt cache of Bedrock."""
+
+    # Seconds a cached prefix is kept after its last use
+    CACHE_TTL = 300
+
+    def __init__(self, output_tokens=300, dimensions=1536, **kwargs):
+        """Initialize FakeBedrock.
+
+        Args:
+            output_tokens (int): Approximate number of tokens of every completion.
+            dimensions (int): Length of the embeddings.
+            **kwargs: See FakeService.
+        """
+        super().__init__('Bedrock', **kwargs)
+        self.output_tokens = output_tokens
+        self.dimensions = dimensions
+        self.prompt_cache = {}
+
+    def invoke_model(self, modelId, body, **kwargs):
+        self.request('InvokeModel')
+        request = json.loads(body)
+        if 'inputText' in request:
+            seed = sum(request['inputText'].encode('utf-8')) % 1000
+            result = {'embedding': [(seed + i) % 100 / 100 for i in range(self.dimensions)]}
+        else:
+            result = self.completion(request['messages'][-1]['content'], request.get('stop_sequences'))
+        return {'body': io.BytesIO(json.dumps(result).encode('utf-8'))}
+
+    def invoke_model_with_response_stream(self, modelId, body, **kwargs):
+        delay = self.request('InvokeModelWithResponseStream', wait=False)
+        request = json.loads(body)
+        result = self.completion(request['messages'][-1]['content'], request.get('stop_sequences'))
+        return {'body': self.stream(result, delay)}
+
+    def cache_usage(self, blocks):
+        """
+        Read the prefix ending at the last block marked with cache_control from the cache, or write it.
+        Returns:
+            usage (dict): The cache_read_input_tokens and cache_creation_input_tokens of the prefix.
+        """
+        marked = [index for index, block in enumerate(blocks) if 'cache_control' in block]
+        if not marked:
+            return {'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+        prefix = ''.join(block['text'] for block in blocks[:marked[-1] + 1])
+        key = hashlib.sha256(prefix.encode('utf-8')).hexdigest()
+        now = time.monotonic()
+        with self.lock:
+            hit = self.prompt_cache.get(key, 0) > now
+            self.prompt_cache[key] = now + self.CACHE_TTL
+        tokens = len(prefix) // 4
+        return {'cache_read_input_tokens': tokens if hit else 0, 'cache_creation_input_tokens': 0 if hit else tokens}
+
+    def stream(self, result, delay, chunks=20):
+        """Yield the events of a response stream, the first token arrives after a fifth of the latency."""
+        def event(chunk):
+            return {'chunk': {'bytes': json.dumps(chunk).encode('utf-8')}}
+        time.sleep(delay / 5)
+        usage = {key: value for key, value in result['usage'].items() if key != 'output_tokens'}
+        yield event({'type': 'message_start', 'message': {'usage': usage}})
+        text = result['content'][0]['text']
+        size = max(1, len(text) // chunks)
+        for start in range(0, len(text), size):
+            yield event({'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': text[start:start + size]}})
+            time.sleep(delay * 4 / 5 / chunks)
+        delta = {'stop_reason': result['stop_reason'], 'stop_sequence': result['stop_sequence']}
+        yield event({'type': 'message_delta', 'delta': delta, 'usage': {'output_tokens': result['usage']['output_tokens']}})
+        yield event({'type': 'message_stop'})
+
+    def completion(self, blocks, stop=None):
+        prompt = ''.join(block['text'] for block in blocks)
+        cache_usage = self.cache_usage(blocks)
+        filename = re.search(r'Filename: (\S+)', prompt)
+        if filename:
+            path = filename.group(1)
+            text = (
+                f"<commands>CREATE (f:File {{name: '{path}', path: '{path}'}}) RETURN id(f) as id;</commands>"
+                f"<file_paths></file_paths>"
+            )
+        elif re.search(r'<\w+> task:', prompt):
+            # A combined prompt gets every section, each as long as a separate answer
+            answer = ' '.join(['documentation'] * self.output_tokens)
+            text = ''.join(f"<{section}>{answer}</{section}>" for section in re.findall(r'<(\w+)> task:', prompt))
+        else:
+            text = ' '.join(['documentation'] * self.output_tokens)
+        # The generation ends before the first stop sequence
+        stops = sorted((text.find(sequence), sequence) for sequence in stop or [] if sequence in text)
+        stop_sequence = stops[0][1] if stops else None
+        if stop_sequence:
+            text = text[:stops[0][0]]
+        return {
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'stop_sequence' if stop_sequence else 'end_turn',
+            'stop_sequence': stop_sequence,
+            # About 4 characters per token, the cached prefix is not part of the input tokens
+            'usage': {
+                'input_tokens': len(prompt) // 4 - sum(cache_usage.values()),
+                'output_tokens': len(text) // 4,
+                **cache_usage,
+            },
+        }
+
+class FakeAmazonQ(FakeService):
+    """A class to stand in for the qbusiness client."""
+
+    def __init__(self, **kwargs):
+        super().__init__('Amazon Q', **kwargs)
+        self.documents = 0
+
+    def batch_put_document(self, documents, **kwargs):
+        self.request('BatchPutDocument')
+        with self.lock:
+            self.documents += len(documents)
+        return {'failedDocuments': []}
+
+    def batch_delete_document(self, documents, **kwargs):
+        self.request('BatchDeleteDocument')
+        return {'failedDocuments': []}
+
+    def start_data_source_sync_job(self, **kwargs):
+        self.request('StartDataSourceSyncJob')
+        return {'executionId': str(uuid.uuid4())}
+
+    def stop_data_source_sync_job(self, **kwargs):
+        self.request('StopDataSourceSyncJob')
+        return {}
+
+class FakeNeptuneGraph(FakeService):
+    """A class to stand in for the neptune-graph client. Queries return no rows."""
+
+    def __init__(self, **kwargs):
+        super().__init__('Neptune', **kwargs)
+
+    def execute_query(self, queryString, **kwargs):
+        self.request('ExecuteQuery')
+        return {'payload': io.BytesIO(json.dumps({'results': []}).encode('utf-8'))}
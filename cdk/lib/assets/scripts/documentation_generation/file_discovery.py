@@ -0,0 +1,144 @@
+import fnmatch
+import hashlib
+import os
+from collections import Counter
+
+IGNORED_DIRECTORIES = {'node_modules', '__pycache__'}
+DEFAULT_EXCLUDE_GLOBS = [
+    # Images, archives and compiled files
+    '*.png', '*.jpg', '*.jpeg', '*.gif', '*.zip', '*.pyc',
+    # Lockfiles
+    'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock', 'Pipfile.lock',
+    'Cargo.lock', 'Gemfile.lock', 'composer.lock', 'go.sum',
+    # Minified bundles and source maps
+    '*.min.js', '*.min.css', '*.map',
+]
+# Number of bytes read to tell text from binary files
+SNIFF_BYTES = 8192
+
+def parse_gitignore(directory):
+    """
+    Read the .gitignore of a directory.
+    Args:
+        directory (str): The directory that may contain a .gitignore.
+    Returns:
+        rules (list): (base directory, pattern, negated, directory only) tuples.
+    """
+    path = os.path.join(directory, '.gitignore')
+    if not os.path.isfile(path):
+        return []
+    rules = []
+    with open(path, 'r', errors='ignore') as f:
+        for line in f:
+            line = line.rstrip('\n').rstrip()
+            if not line or line.startswith('#'):
+                continue
+            negated = line.startswith('!')
+            if negated:
+                line = line[1:]
+            directory_only = line.endswith('/')
+            line = line.rstrip('/')
+            if line:
+                rules.append((directory, line, negated, directory_only))
+    return rules
+
+def is_gitignored(path, is_directory, rules):
+    # The last matching rule wins, so a negated rule can re-include a path
+    ignored = False
+    for base, pattern, negated, directory_only in rules:
+        if directory_only and not is_directory:
+            continue
+        relative_path = os.path.relpath(path, base).replace(os.sep, '/')
+        if '/' in pattern:
+            matched = fnmatch.fnmatch(relative_path, pattern.lstrip('/'))
+        else:
+            matched = fnmatch.fnmatch(os.path.basename(path), pattern)
+        if matched:
+            ignored = not negated
+    return ignored
+
+def shard_of(path, shard_count):
+    """
+    Assign a file to a shard by the hash of its path, so every job of an array job agrees on it.
+    Args:
+        path (str): The file, relative to the repository root.
+        shard_count (int): The number of shards.
+    Returns:
+        int: The shard index, from 0 to shard_count - 1.
+    """
+    digest = hashlib.sha256(path.replace(os.sep, '/').encode('utf-8')).hexdigest()
+    return int(digest[:8], 16) % shard_count
+
+def is_binary(path):
+    """Sniff the first bytes of a file: NUL bytes or invalid UTF-8 mean it is not text."""
+    with open(path, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+    if b'\0' in head:
+        return True
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character may be cut at the end of the sniffed bytes
+        return e.start < len(head) - 3
+    return False
+
+class FileDiscovery:
+    """A class to find the files of a repository worth sending to the model."""
+
+    def __init__(self, include_globs=None, exclude_globs=None, max_file_bytes=None):
+        """Initialize FileDiscovery with the given filters.
+
+        Args:
+            include_globs (list): Only files matching one of these globs are yielded, all files if empty.
+            exclude_globs (list): Files matching one of these globs are skipped, on top of the defaults.
+            max_file_bytes (int): Files larger than this are skipped.
+        """
+        self.include_globs = include_globs or []
+        self.exclude_globs = DEFAULT_EXCLUDE_GLOBS + (exclude_globs or [])
+        self.max_file_bytes = max_file_bytes
+        self.skipped = Counter()
+
+    def discover(self, root):
+        """
+        Walk a repository and lazily yield the files to process.
+        Args:
+            root (str): The repository working tree.
+        Yields:
+            file_path (str): The path of a text file that passed every filter.
+        """
+        gitignore_rules = {root: parse_gitignore(root)}
+        for directory, dirs, files in os.walk(root):
+            rules = gitignore_rules.pop(directory)
+            # Prune ignored directories so they are never walked
+            kept_dirs = []
+            for name in dirs:
+                path = os.path.join(directory, name)
+                if name.startswith('.') or name in IGNORED_DIRECTORIES or is_gitignored(path, True, rules):
+                    continue
+                kept_dirs.append(name)
+                gitignore_rules[path] = rules + parse_gitignore(path)
+            dirs[:] = kept_dirs
+            for name in files:
+                file_path = os.path.join(directory, name)
+                reason = self._skip_reason(root, file_path, rules)
+                if reason:
+                    self.skipped[reason] += 1
+                    continue
+                yield file_path
+
+    def _skip_reason(self, root, file_path, rules):
+        name = os.path.basename(file_path)
+        relative_path = os.path.relpath(file_path, root).replace(os.sep, '/')
+        if name.startswith('.') or os.path.islink(file_path):
+            return 'hidden'
+        if is_gitignored(file_path, False, rules):
+            return 'gitignored'
+        if self.include_globs and not any(fnmatch.fnmatch(relative_path, glob) for glob in self.include_globs):
+            return 'not included'
+        if any(fnmatch.fnmatch(relative_path, glob) or fnmatch.fnmatch(name, glob) for glob in self.exclude_globs):
+            return 'excluded'
+        if self.max_file_bytes and os.path.getsize(file_path) > self.max_file_bytes:
+            return 'too large'
+        if is_binary(file_path):
+            return 'binary'
+        return None
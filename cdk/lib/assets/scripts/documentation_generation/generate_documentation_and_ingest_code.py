@@ -1,39 +1,206 @@
-import boto3
 import json
-import datetime
 import os 
+import posixpath
+import re
 import git
 import shutil
 import tempfile
-import uuid
-import re
-import random
+import time
+import threading
+import storage
+from concurrent.futures import Future, ThreadPoolExecutor
+from document_writer import DocumentWriter, document_id
+from embedding_service import EmbeddingService
+from rate_limiter import AdaptiveRateLimiter, is_retryable_error
+from llm_cache import create_llm_cache
+from file_discovery import FileDiscovery, shard_of
+from chunking import chunk_code
+from graph_writer import GraphWriter
+from graph_output import GraphOutputError, parse_graph_output
+from combined_prompt import combined_instructions, split_sections, word_overlap
+from code_graph import build_graph, write_graph, graph_node_ids
+from graph_export import GraphExporter, start_import
+from opencypher_parser import parse_create_pattern, node_id, properties_node_id, merge_relationship
+from checkpoint import Checkpoint
+from ingestion_manifest import (
+    load_manifest, save_manifest, tree_blobs, diff_manifest, shard_location, delete_manifest, merge_shard_manifests,
+    load_repositories, repository_key, repository_location
+)
+from sync_jobs import SyncJobs
+from aws_clients import get_client
+from metrics import Metrics, save_summary
 
-bedrock = boto3.client('bedrock-runtime')
-amazon_q = boto3.client('qbusiness')
-neptune_graph = boto3.client('neptune-graph')
-bedrock = boto3.client('bedrock-runtime')
+# Clients are shared by all workers, their pools are sized by AWS_MAX_POOL_CONNECTIONS
+# Every Bedrock and Neptune query call goes through a rate limiter, and so do the document uploads
+bedrock = get_client('bedrock-runtime', rate_limited=True)
+amazon_q = get_client('qbusiness')
+neptune_graph = get_client('neptune-graph', rate_limited=True)
 amazon_q_app_id = os.environ['AMAZON_Q_APP_ID']
 index_id = os.environ['Q_APP_INDEX']
 role_arn = os.environ['Q_APP_ROLE_ARN']
 q_app_data_source_id = os.environ['Q_APP_DATA_SOURCE_ID']
-repo_url = os.environ['REPO_URL']
+# The repository, or a JSON list of repositories ingested by the same job
+repo_url = os.environ.get('REPO_URL')
+repositories_location = os.environ.get('REPOSITORIES')
+# Number of repositories of the list processed at the same time, their files share the file workers
+repository_concurrency = int(os.environ.get('REPOSITORY_CONCURRENCY', '4'))
 # Optional retrieve the SSH URL and SSH_KEY_NAME for the repository
 ssh_url = os.environ.get('SSH_URL')
 ssh_key_name = os.environ.get('SSH_KEY_NAME')
 enable_graph = os.environ.get('ENABLE_GRAPH')
 neptune_graph_id = os.environ.get('NEPTUNE_GRAPH_ID')
+# The graph is extracted from the code with static analysis, or by the model when set to llm
+graph_extractor = os.environ.get('GRAPH_EXTRACTOR', 'static')
+# Number of completions requested when the model writes graph commands that do not parse
+graph_attempts = int(os.environ.get('GRAPH_ATTEMPTS', '3'))
+# Stages every file goes through, a file is only checkpointed once all of them finished
+file_stages = ['documents', 'graph'] if enable_graph == 'true' and graph_extractor == 'llm' else ['documents']
+# Optional write the static graph to bulk import CSV files (local directory or s3:// prefix) instead of running queries,
+# and import them with one task when a role Neptune Analytics can read them with is given. An import task only loads
+# into an empty graph, so the graph is written with queries once it has nodes.
+graph_export_location = os.environ.get('GRAPH_EXPORT_LOCATION')
+graph_import_role_arn = os.environ.get('GRAPH_IMPORT_ROLE_ARN')
+# Optional partial clone filter, i.e. blob:none, and directories to check out
+clone_filter = os.environ.get('CLONE_FILTER')
+sparse_checkout = os.environ.get('SPARSE_CHECKOUT')
+# Optional glob filters (space separated) and size limit of the files sent to the model
+include_globs = os.environ.get('INCLUDE_GLOBS', '').split()
+exclude_globs = os.environ.get('EXCLUDE_GLOBS', '').split()
+max_file_bytes = int(os.environ.get('MAX_FILE_BYTES', str(1024 * 1024)))
+# Files estimated above this many tokens are split into chunks documented separately
+max_chunk_tokens = int(os.environ.get('MAX_CHUNK_TOKENS', '16000'))
+# Optional only re-process the files that changed since the previous run
+incremental = os.environ.get('INCREMENTAL')
+manifest_location = os.environ.get('MANIFEST_LOCATION', 'manifest.json')
+# Finished files and stages are checkpointed at most every CHECKPOINT_INTERVAL seconds, so a restarted job resumes
+checkpoint_location = os.environ.get('CHECKPOINT_LOCATION', 'checkpoint.json')
+checkpoint_interval = int(os.environ.get('CHECKPOINT_INTERVAL', '60'))
+# Responses are cached by model ID and prompt, so unchanged files are not sent to the model again
+llm_cache = create_llm_cache(
+    os.environ.get('LLM_CACHE_LOCATION', 'llm_cache.sqlite'),
+    int(os.environ.get('LLM_CACHE_MAX_BYTES', str(1024 * 1024 * 1024)))
+)
+# Optional process a deterministic shard of the files. AWS Batch sets the index of every child of an array job.
+# The sync job of a sharded run is started by the submit Lambda and stopped by a final job with INGESTION_MODE=reduce.
+shard_count = int(os.environ.get('SHARD_COUNT', '1'))
+shard_index = int(os.environ.get('AWS_BATCH_JOB_ARRAY_INDEX', '0'))
+shared_sync_job_id = os.environ.get('SYNC_JOB_ID')
+ingestion_mode = os.environ.get('INGESTION_MODE', 'process')
+# The reduce job only starts when every shard succeeded, so a shard failing on its last attempt
+# records the failure and exits successfully instead. Earlier attempts fail, AWS Batch retries and resumes them.
+job_attempt = int(os.environ.get('AWS_BATCH_JOB_ATTEMPT', '1'))
+job_attempts = int(os.environ.get('JOB_ATTEMPTS', '1'))
+# Duration of every stage and counters of the run, summarized at the end.
+# The summary is written to METRICS_LOCATION when set, and printed as CloudWatch embedded metrics when METRICS_EMF is true.
+metrics = Metrics()
+metrics_location = os.environ.get('METRICS_LOCATION')
+metrics_emf = os.environ.get('METRICS_EMF')
+metrics_namespace = os.environ.get('METRICS_NAMESPACE', 'CodeAnalysis/Ingestion')
+# Optional stream completions with invoke_model_with_response_stream, a generation still running after
+# BEDROCK_STREAM_MAX_SECONDS is abandoned. Bedrock ends every generation at the stop sequences (| separated).
+bedrock_streaming = os.environ.get('BEDROCK_STREAMING')
+stop_sequences = [sequence for sequence in os.environ.get('BEDROCK_STOP_SEQUENCES', '').split('|') if sequence]
+stream_max_seconds = float(os.environ.get('BEDROCK_STREAM_MAX_SECONDS', '0'))
+# Model of the completions. With BEDROCK_PROMPT_CACHING the content of a file is sent as a prefix Bedrock caches,
+# so the separate prompts of a file only pay for it once. The model has to support prompt caching.
+model_id = os.environ.get('BEDROCK_MODEL_ID', 'anthropic.claude-3-sonnet-20240229-v1:0')
+prompt_caching = os.environ.get('BEDROCK_PROMPT_CACHING')
+# The prompts of a file are sent separately, or answered by one combined completion when set to combined, so the
+# content of the file is sent once. compare requests both, uploads the separate answers and saves both side by side
+# to PROMPT_COMPARISON_LOCATION (local path or s3:// URI).
+prompt_mode = os.environ.get('PROMPT_MODE', 'separate')
+prompt_comparison_location = os.environ.get('PROMPT_COMPARISON_LOCATION', 'prompt_comparison.json')
+# Number of files processed at the same time
+max_workers = int(os.environ.get('MAX_WORKERS', '8'))
+# Maximum number of in-flight requests and requests per second per service, shared by all workers.
+# Throttling lowers the rate until the service accepts it again.
+bedrock_limiter = AdaptiveRateLimiter(
+    'Bedrock',
+    float(os.environ.get('BEDROCK_MAX_RATE', '5')),
+    int(os.environ.get('BEDROCK_CONCURRENCY', '4'))
+)
+amazon_q_limiter = AdaptiveRateLimiter(
+    'Amazon Q',
+    float(os.environ.get('Q_MAX_RATE', '10')),
+    int(os.environ.get('Q_CONCURRENCY', '4'))
+)
+neptune_limiter = AdaptiveRateLimiter(
+    'Neptune',
+    float(os.environ.get('NEPTUNE_MAX_RATE', '20')),
+    int(os.environ.get('NEPTUNE_CONCURRENCY', '2'))
+)
+# Embeddings have their own quota, so a large graph does not queue behind the completions
+embedding_limiter = AdaptiveRateLimiter(
+    'Bedrock embeddings',
+    float(os.environ.get('EMBEDDING_MAX_RATE', '20')),
+    int(os.environ.get('EMBEDDING_CONCURRENCY', '8'))
+)
+# Labels of the static graph nodes that get a vector (space separated)
+graph_embedded_labels = tuple(os.environ.get('GRAPH_EMBEDDED_LABELS', 'File Module Class').split())
+
+PROMPTS = [
+    "Come up with a list of questions and answers about the attached file. Keep answers dense with information. A good question for a database related file would be 'What is the database technology and architecture?' or for a file that executes SQL commands 'What are the SQL commands and what do they do?' or for a file that contains a list of API endpoints 'What are the API endpoints and what do they do?'",
+    "Generate comprehensive documentation about the attached file. Make sure you include what dependencies and other files are being referenced as well as function names, class names, and what they do.",
+    "Identify anti-patterns in the attached file. Make sure to include examples of how to fix them. Try Q&A like 'What are some anti-patterns in the file?' or 'What could be causing high latency?'",
+    "Suggest improvements to the attached file. Try Q&A like 'What are some ways to improve the file?' or 'Where can the file be optimized?'"
+]
+# Tag of the answer of each prompt in a combined completion, in the order of PROMPTS
+PROMPT_SECTIONS = ['questions', 'documentation', 'anti_patterns', 'improvements']
+# Stage the completions of each prompt are timed under
+PROMPT_STAGES = [f"completion.{section}" for section in PROMPT_SECTIONS]
+# Answers of both prompt modes when comparing them, saved at the end of the run
+prompt_comparisons = []
+prompt_comparisons_lock = threading.Lock()
+# The prompts of a file are independent, so they are sent to Bedrock at the same time.
+# This pool is separate from the file workers to avoid workers waiting on each other.
+prompt_executor = ThreadPoolExecutor(max_workers=max_workers * len(PROMPTS))
+# Files of every repository of the job are processed by the same workers
+file_executor = ThreadPoolExecutor(max_workers=max_workers)
+# Documents of all files are buffered and uploaded to the index in full batches
+document_writer = DocumentWriter(get_client('qbusiness', rate_limited=True), amazon_q_app_id, index_id, role_arn, amazon_q_limiter, metrics)
+# Repositories uploading to the same data source share its sync job, the buffered documents are uploaded before it stops
+sync_jobs = SyncJobs(amazon_q, amazon_q_app_id, index_id, before_stop=document_writer.flush)
+# One Bedrock client and cache shared by every embedding request
+embedding_service = EmbeddingService(
+    bedrock,
+    "amazon.titan-embed-text-v1",
+    cache_directory=os.environ.get('EMBEDDING_CACHE_DIRECTORY', 'embedding_cache/'),
+    max_workers=max_workers,
+    limiter=embedding_limiter,
+    metrics=metrics
+)
 
 def main():
+    # The submit Lambda times the copy of the scripts, it runs before Python starts
+    if os.environ.get('COPY_SECONDS'):
+        metrics.record('copy', float(os.environ['COPY_SECONDS']))
+    if repositories_location:
+        process_repositories(load_repositories(repositories_location))
+        report_totals()
+        return
+    if ingestion_mode == 'reduce':
+        print(f"Reducing {shard_count} shards of repository... {repo_url}")
+        reduce_shards(repo_url, ssh_url if ssh_url and ssh_url.endswith('.git') else None)
+        report_totals()
+        return
     print(f"Processing repository... {repo_url}")
-    # If ssh_url ends with .git then process it
-    if ssh_url and ssh_url.endswith('.git'):
-        process_repository(repo_url, ssh_url)
-    else:
-        process_repository(repo_url)
+    try:
+        # If ssh_url ends with .git then process it
+        if ssh_url and ssh_url.endswith('.git'):
+            process_repository(repo_url, ssh_url)
+        else:
+            process_repository(repo_url)
+    except Exception as e:
+        if shard_count == 1 or job_attempt < job_attempts:
+            raise
+        fail_shard(e)
+    report_totals()
     print(f"Finished processing repository {repo_url}")
 
-def format_prompt(prompt, code_text, file_path):
+def format_prompt(prompt, code_text, file_path, lines=None):
+     if lines:
+         # Only part of the file is attached
+         file_path = f"{file_path} (lines {lines})"
      formatted_prompt = f"""
      {prompt}
      File name: {file_path}
@@ -42,67 +209,257 @@ def format_prompt(prompt, code_text, file_path):
      
      return formatted_prompt    
 
-def bedrock_completion(prompt):
-     model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
-     response = bedrock.invoke_model(
-         modelId=model_id,
-         body=json.dumps(
-            {
-                "anthropic_version": "bedrock-2023-05-31",
-                 "max_tokens": 1024,
-                 "messages": [
-                     {
-                         "role": "user",
-                         "content": [{"type": "text", "text": prompt}],
-                  }
-               ],
-             }
-        ),
-     )
-     result = json.loads(response.get("body").read())
-
-     return result.get("content", [])
-
-
-def upload_prompt_answer_and_file_name(filename, prompt, answer, repo_url, branch, sync_job_id):
+def format_file_context(code_text, file_path, lines=None):
+    """The file name and content, sent before the prompt when the prompt cache is used."""
+    if lines:
+        file_path = f"{file_path} (lines {lines})"
+    return f"File name: {file_path}\nFile content: {code_text}\n"
+
+def bedrock_completion(prompt, refresh=False, stage='completion', stop=None, max_tokens=1024, context=None):
+     # The context, i.e. the file content, is sent before the prompt as a prefix Bedrock caches for the next prompts
+     content = [{"type": "text", "text": prompt}]
+     if context:
+         content.insert(0, {"type": "text", "text": context, "cache_control": {"type": "ephemeral"}})
+     request = {
+            "anthropic_version": "bedrock-2023-05-31",
+             "max_tokens": max_tokens,
+             "messages": [
+                 {
+                     "role": "user",
+                     "content": content,
+              }
+           ],
+         }
+     # Bedrock ends the generation at a stop sequence, so the usage only counts the tokens generated up to it
+     stop = stop_sequences + (stop or [])
+     if stop:
+         request["stop_sequences"] = stop
+     body = json.dumps(request)
+     # Completions are cached by the whole request, so changing the settings of the completion misses the cache.
+     # A refresh skips the cached completion and replaces it.
+     cached_content = None if refresh else llm_cache.get(model_id, body)
+     if cached_content is not None:
+         return cached_content
+     with metrics.timer(stage):
+         if bedrock_streaming == 'true':
+             # The stream is read within the limiter, so BEDROCK_CONCURRENCY also caps the generations being read
+             result = bedrock_limiter.call(stream_completion, model_id, body)
+         else:
+             response = bedrock_limiter.call(
+                 bedrock.invoke_model,
+                 modelId=model_id,
+                 body=body,
+             )
+             result = json.loads(response.get("body").read())
+     usage = result.get("usage", {})
+     metrics.increment('input_tokens', usage.get('input_tokens', 0))
+     metrics.increment('output_tokens', usage.get('output_tokens', 0))
+     # Cached prefix tokens are not part of input_tokens, reads cost a tenth of them and writes a quarter more
+     metrics.increment('cache_read_input_tokens', usage.get('cache_read_input_tokens', 0))
+     metrics.increment('cache_write_input_tokens', usage.get('cache_creation_input_tokens', 0))
+     metrics.increment('bedrock_bytes_sent', len(body))
+     if prompt_mode == 'compare':
+         # Tokens of every stage, so the cost of both prompt modes can be compared
+         metrics.increment(f"{stage}.input_tokens", usage.get('input_tokens', 0))
+         metrics.increment(f"{stage}.output_tokens", usage.get('output_tokens', 0))
+         metrics.increment(f"{stage}.cache_read_input_tokens", usage.get('cache_read_input_tokens', 0))
+         metrics.increment(f"{stage}.cache_write_input_tokens", usage.get('cache_creation_input_tokens', 0))
+     content = result.get("content", [])
+     # The stop sequence is not part of the text, it is added back so the closing tag of the answer is kept
+     if result.get("stop_reason") == "stop_sequence" and content:
+         content[-1]["text"] += result.get("stop_sequence") or ""
+         metrics.increment('stopped_generations')
+     # An abandoned generation is incomplete, it is generated again by the next run
+     if not result.get("abandoned"):
+         llm_cache.put(model_id, body, content)
+
+     return content
+
+
+def stream_completion(model_id, body):
+    """
+    Request a completion with invoke_model_with_response_stream and accumulate its text as the chunks arrive.
+    Args:
+        model_id (str): The Bedrock model ID.
+        body (str): The request body.
+    Returns:
+        result (dict): The content, usage, stop_reason and stop_sequence, like the invoke_model response,
+        and abandoned when the generation ran longer than BEDROCK_STREAM_MAX_SECONDS.
+    """
+    started = time.perf_counter()
+    response = bedrock.invoke_model_with_response_stream(modelId=model_id, body=body)
+    stream = response['body']
+    text = ''
+    usage = {'input_tokens': 0, 'output_tokens': 0}
+    deltas = 0
+    stop_reason = None
+    stop_sequence = None
+    abandoned = False
+    try:
+        for event in stream:
+            chunk = json.loads(event['chunk']['bytes'])
+            if chunk['type'] == 'message_start':
+                usage.update(chunk['message']['usage'])
+            elif chunk['type'] == 'message_delta':
+                usage['output_tokens'] = chunk['usage']['output_tokens']
+                stop_reason = chunk['delta'].get('stop_reason')
+                stop_sequence = chunk['delta'].get('stop_sequence')
+            elif chunk['type'] == 'content_block_delta':
+                if deltas == 0:
+                    metrics.record('time_to_first_token', time.perf_counter() - started)
+                deltas += 1
+                text += chunk['delta'].get('text', '')
+                if stream_max_seconds and time.perf_counter() - started > stream_max_seconds:
+                    abandoned = True
+                    break
+    finally:
+        # Closing the connection stops reading the rest of the generation
+        stream.close()
+    if abandoned:
+        # The final usage is only sent at the end of the stream, message_start already counts the first token.
+        # The generated tokens are estimated from the text, about 4 characters per token.
+        usage['output_tokens'] = max(usage['output_tokens'], len(text) // 4)
+        metrics.increment('abandoned_generations')
+    metrics.increment('stream_chunks', deltas)
+    return {
+        'content': [{'type': 'text', 'text': text}],
+        'usage': usage,
+        'stop_reason': stop_reason,
+        'stop_sequence': stop_sequence,
+        'abandoned': abandoned,
+    }
+
+def cached_prompt_answers(requests, file_path):
+    """
+    Answer the separate prompts of a file with its content as a cached prefix. The first prompt of every chunk writes
+    the prefix to the cache, the other prompts are only sent once it finished so they read it instead of writing it again.
+    Args:
+        requests (list): (prompt, lines, text) of every prompt of every chunk.
+        file_path (str): The path of the file.
+    Returns:
+        answers (list): The answer of every request, in order.
+    """
+    answers = [None] * len(requests)
+
+    def complete(index):
+        prompt, lines, text = requests[index]
+        return bedrock_completion(
+            prompt, stage=PROMPT_STAGES[PROMPTS.index(prompt)], context=format_file_context(text, file_path, lines)
+        )
+
+    first = [index for index, (prompt, lines, text) in enumerate(requests) if prompt == PROMPTS[0]]
+    rest = [index for index, (prompt, lines, text) in enumerate(requests) if prompt != PROMPTS[0]]
+    for indexes in (first, rest):
+        for index, answer in zip(indexes, prompt_executor.map(complete, indexes)):
+            answers[index] = answer
+    return answers
+
+def combined_completion(code_text, file_path, lines=None):
+    """
+    Answer every prompt of a file, or of a chunk, with one completion, so its content is sent once instead of once per prompt.
+    A section missing from the output, i.e. when the completion ran out of tokens, is answered by its separate prompt.
+    Returns:
+        answers (list): The answer of every prompt in the order of PROMPTS, shaped like the content bedrock_completion returns.
+    """
+    prompt = format_prompt(combined_instructions(PROMPTS, PROMPT_SECTIONS), code_text, file_path, lines)
+    content = bedrock_completion(
+        prompt,
+        stage='completion.combined',
+        stop=[f"</{PROMPT_SECTIONS[-1]}>"],
+        max_tokens=len(PROMPTS) * 1024
+    )
+    sections = split_sections(''.join(block.get('text', '') for block in content), PROMPT_SECTIONS)
+    answers = []
+    for prompt, section, stage in zip(PROMPTS, PROMPT_SECTIONS, PROMPT_STAGES):
+        if sections[section]:
+            answers.append([{'type': 'text', 'text': sections[section]}])
+        else:
+            metrics.increment('missing_sections')
+            answers.append(bedrock_completion(format_prompt(prompt, code_text, file_path, lines), stage=stage))
+    return answers
+
+def compare_answers(file_path, requests, separate_answers, combined_answers):
+    """Keep the answers of both prompt modes for every prompt of a file, with their lengths and word overlap."""
+    comparisons = []
+    for (prompt, lines, text), separate, combined in zip(requests, separate_answers, combined_answers):
+        separate_text = ''.join(block.get('text', '') for block in separate)
+        combined_text = ''.join(block.get('text', '') for block in combined)
+        comparisons.append({
+            'file': file_path,
+            'lines': lines,
+            'section': PROMPT_SECTIONS[PROMPTS.index(prompt)],
+            'separate_length': len(separate_text),
+            'combined_length': len(combined_text),
+            'word_overlap': round(word_overlap(separate_text, combined_text), 3),
+            'separate': separate_text,
+            'combined': combined_text,
+        })
+    with prompt_comparisons_lock:
+        prompt_comparisons.extend(comparisons)
+
+def save_prompt_comparison():
+    """Save the compared answers with the mean overlap and lengths per section, and the tokens of both modes."""
+    counters = metrics.summary()['counters']
+    sections = {}
+    for section in PROMPT_SECTIONS:
+        compared = [comparison for comparison in prompt_comparisons if comparison['section'] == section]
+        if compared:
+            sections[section] = {
+                'count': len(compared),
+                'mean_word_overlap': round(sum(c['word_overlap'] for c in compared) / len(compared), 3),
+                'separate_length': sum(c['separate_length'] for c in compared),
+                'combined_length': sum(c['combined_length'] for c in compared),
+            }
+    tokens = {}
+    for mode, stages in [('separate', PROMPT_STAGES), ('combined', ['completion.combined'])]:
+        tokens[mode] = {
+            kind: sum(counters.get(f"{stage}.{kind}", 0) for stage in stages)
+            for kind in ('input_tokens', 'cache_read_input_tokens', 'cache_write_input_tokens', 'output_tokens')
+        }
+    location = prompt_comparison_location
+    if shard_count > 1:
+        location = shard_location(prompt_comparison_location, shard_index)
+    save_summary(location, {'sections': sections, 'tokens': tokens, 'answers': prompt_comparisons})
+    print(f"Prompt comparison of {len(prompt_comparisons)} answers saved to {location}: {json.dumps(tokens)}")
+
+def upload_prompt_answer_and_file_name(filename, prompt, answer, repo_url, branch, sync_job_id, lines=None, root='repositories/', data_source_id=None):
     base_url = repo_url[:-4]
-    cleaned_file_name = f"{base_url}/blob/{branch}/{'/'.join(filename.split('/')[1:])}"
+    cleaned_file_name = f"{base_url}/blob/{branch}/{os.path.relpath(filename, root)}"
     print(f"Cleaned File Name: {cleaned_file_name}")
-    amazon_q.batch_put_document(
-        applicationId=amazon_q_app_id,
-        indexId=index_id,
-        roleArn=role_arn,
-        documents=[
-            {
-                'id': str(uuid.uuid4()),
-                'contentType': 'PLAIN_TEXT',
-                'title': cleaned_file_name,
-                'content':{
-                    'blob': f"{cleaned_file_name} | {prompt} | {answer}".encode('utf-8')
+    # The documents of every chunk share the source URI of the file
+    _id = document_id(cleaned_file_name, f"{prompt}|{lines}" if lines else prompt)
+    title = f"{cleaned_file_name} (lines {lines})" if lines else cleaned_file_name
+    document_writer.add(
+        {
+            'id': _id,
+            'contentType': 'PLAIN_TEXT',
+            'title': title,
+            'content':{
+                'blob': f"{title} | {prompt} | {answer}".encode('utf-8')
+            },
+            'attributes': [
+                {
+                    'name': '_source_uri',
+                    'value': {
+                        'stringValue': cleaned_file_name
+                    }
                 },
-                'attributes': [
-                    {
-                        'name': '_source_uri',
-                        'value': {
-                            'stringValue': cleaned_file_name
-                        }
-                    },
-                    {
-                        'name': '_data_source_id',
-                        'value': {
-                            'stringValue': q_app_data_source_id
-                        }
-                    },
-                    {
-                        'name': '_data_source_sync_job_execution_id',
-                        'value': {
-                            'stringValue': sync_job_id
-                        }
+                {
+                    'name': '_data_source_id',
+                    'value': {
+                        'stringValue': data_source_id or q_app_data_source_id
                     }
-                ],
-            },
-        ]
+                },
+                {
+                    'name': '_data_source_sync_job_execution_id',
+                    'value': {
+                        'stringValue': sync_job_id
+                    }
+                }
+            ],
+        }
     )
+    return _id
 
 # Function to save generated answers to folder documentation/
 def save_answers(answer, filepath, folder):
@@ -117,19 +474,8 @@ def save_answers(answer, filepath, folder):
     with open(f"{folder}{filepath}", "w") as f:
         f.write(str(answer))
 
-def should_ignore_path(path):
-    path_components = path.split(os.sep)
-    for component in path_components:
-        if component.startswith('.'):
-            return True
-        elif component == 'node_modules':
-            return True
-        elif component == '__pycache__':
-            return True
-    return False
-
 def get_ssh_key(secret_name):
-    client = boto3.client('secretsmanager')
+    client = get_client('secretsmanager')
     response = client.get_secret_value(SecretId=secret_name)
     return response['SecretString']
 
@@ -143,34 +489,46 @@ def generate_embeddings(body):
     """
     Generate a vector of embeddings for a text input using Amazon Titan Embeddings G1 - Text on demand.
     Args:
-        model_id (str): The model ID to use.
-        body (str) : The request body to use.
+        body (str) : The text to embed.
     Returns:
-        response (JSON): The text that the model generated, token information, and the
-        reason the model stopped generating text.
+        embedding (list): The embedding, served from the cache when the text was embedded before.
     """
+    return embedding_service.embed(body)
 
-    bedrock = boto3.client(service_name='bedrock-runtime')
-
-    accept = "application/json"
-    content_type = "application/json"
-    model_id = "amazon.titan-embed-text-v1"
-
-    response = bedrock.invoke_model(
-        body=json.dumps({
-                    "inputText": body
-                }), modelId=model_id, accept=accept, contentType=content_type
-    )
-
-    response_body = json.loads(response.get('body').read())
+def clone_repository(url, destination_folder, env=None):
+    """
+    Clone only the latest commit of the default branch.
+    Args:
+        url (str): The HTTPS or SSH URL of the repository.
+        destination_folder (str): The folder the working tree is checked out to.
+        env (dict): Optional environment of the git command, i.e. GIT_SSH_COMMAND.
+    Returns:
+        repo (git.Repo): The cloned repository.
+    """
+    multi_options = ['--depth=1', '--single-branch']
+    if clone_filter:
+        multi_options.append(f"--filter={clone_filter}")
+    if sparse_checkout:
+        multi_options.append('--sparse')
+    repo = git.Repo.clone_from(url, destination_folder, env=env, multi_options=multi_options)
+    if sparse_checkout:
+        # Missing blobs of a partial clone are fetched for the sparse directories only
+        repo.git.sparse_checkout('set', *sparse_checkout.split())
+    return repo
 
-    return response_body['embedding']
+def repository_path(file_path, root):
+    """A path written by the model relative to the repository root, i.e. repositories/org/repo/src/main.py or ./src/main.py to src/main.py."""
+    if file_path.startswith(root):
+        file_path = os.path.relpath(file_path, root)
+    return posixpath.normpath(file_path.replace(os.sep, '/')).lstrip('/')
 
-def add_graph_nodes_and_edges(code_file):
+def add_graph_nodes_and_edges(code_file, repo_url, root='repositories/'):
     # Turn code file into text
     code = open(code_file, 'r')
     code_text = code.read()
     code.close()
+    # Nodes are identified, linked and pruned by the path relative to the repository root, never the clone folder
+    path = os.path.relpath(code_file, root)
     # Process code with prompt
     prompt = f"""
     You are a Neptune Graph Applied Scientist familiar with Generative AI.
@@ -184,178 +542,461 @@ def add_graph_nodes_and_edges(code_file):
     Seperate queries with ;
     Capture information and relationships on functions, classes, and other relevant information.
     Repository: {repo_url}
-    Filename: {code_file}
+    Filename: {path}
     File content: {code_text}
     """
-    model_id = "anthropic.claude-3-sonnet-20240229-v1:0"
-    response = bedrock.invoke_model(
-        modelId=model_id,
-        body=json.dumps(
-            {
-                "anthropic_version": "bedrock-2023-05-31",
-                "max_tokens": 1024,
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": [{"type": "text", "text": prompt}],
-                    }
-                ],
-            }
-        ),
-    )
-    result = json.loads(response.get("body").read())
-    output_list = result.get("content", [])
-    for output in output_list:
-        code_text += output["text"]
-    # Parse commands out of code_text
-    commands = re.findall(r'<commands>(.*?)</commands>', code_text, re.DOTALL)
-    # Print commands
-    print(commands[0])
-    # Split by ; and execute each command
-    commands = commands[0].split(';')
+    # Only the graph step is retried when the output does not parse, the documents of the file are already uploaded
+    for attempt in range(graph_attempts):
+        # The cached completion would fail the same way, so retries ask the model again
+        if attempt > 0:
+            metrics.increment('graph_retries')
+        # Nothing is expected after the file paths, a streamed completion stops reading there
+        output_list = bedrock_completion(prompt, refresh=attempt > 0, stage='completion.graph', stop=['</file_paths>'])
+        output = ''.join(block["text"] for block in output_list)
+        try:
+            commands, file_paths, rejected = parse_graph_output(output)
+            break
+        except GraphOutputError as e:
+            print(f"Invalid graph output for {code_file} (attempt {attempt + 1}): {e}")
+    else:
+        print(f"\033[93mSkipping graph of file: {code_file}\033[0m")
+        return False
+    for command, reason in rejected:
+        print(f"Dropped graph command ({reason}): {command}")
+    graph_writer = GraphWriter(neptune_graph, neptune_graph_id, embedding_service, neptune_limiter, metrics)
     for command in commands:
-        # Check if create command
-        if 'CREATE' in command:
-            r = neptune_graph.execute_query(
-                graphIdentifier=neptune_graph_id,
-                queryString=command,
-                language='opencypher'
-            )
-            response = r['payload'].read().decode('utf-8')
-            response = json.loads(response)
-            # Check if id was returned
-            if len(response['results']) == 0:
-                continue
-            node_id = response['results'][0]['id']
-            # Get Embedding
-            # Upsert titan generated embedding for the node that was just created Expression: File {name: 'LexBedrockMessageProcessor.py', path: 'bedrock/knowledge-base-lex-langsmith/lambda/LexBedrockMessageProcessor.py'}
-            # Generate embedding
-            embedding = generate_embeddings(command)
-            query = f"""
-            MATCH (n{{`~id`: "{node_id}"}})
-            CALL neptune.algo.vectors.upsert(n, {str(embedding)})
-            YIELD node, embedding, success
-            RETURN node, embedding, success
-            """
-            neptune_graph.execute_query(
-                graphIdentifier=neptune_graph_id,
-                queryString=query,
-                language='opencypher'
-            )
-    # Create OpenCypher command to link related files to the uploaded file
-    file_paths = re.search(r'<file_paths>(.*?)</file_paths>', code_text, re.DOTALL)
-    file_paths = file_paths[0].split('\n')
+        # Created nodes are batched per label and their relationships per type, anything else runs as it is after them.
+        # The command text of a single node is embedded as its vector, i.e. File {name: 'LexBedrockMessageProcessor.py', path: 'bedrock/knowledge-base-lex-langsmith/lambda/LexBedrockMessageProcessor.py'}
+        # Nodes are upserted by an ID derived from the repository, path and name, so re-runs do not duplicate them
+        create = parse_create_pattern(command)
+        if create:
+            nodes, relationships = create
+            ids = {}
+            for variable, label, properties in nodes:
+                embedding_text = command if len(nodes) == 1 else f"{label} {json.dumps(properties)}"
+                properties['repo'] = repo_url
+                if label == 'File' and properties.get('path'):
+                    # A file is the same node whichever file's graph wrote it
+                    properties['path'] = repository_path(properties['path'], root)
+                elif label != 'File':
+                    # Symbols belong to the file, so symbols of different files with the same name stay separate nodes
+                    properties['path'] = path
+                # The file whose graph owns the node, its nodes are pruned with it. A File node of another file is only
+                # referred to, it is owned by the graph of that file.
+                if label != 'File' or properties.get('path') == path:
+                    properties['file'] = path
+                ids[variable] = properties_node_id(label, properties, repo_url)
+                graph_writer.add_node(ids[variable], label, properties, embedding_text=embedding_text)
+            for from_variable, relationship, to_variable in relationships:
+                graph_writer.add_edge(ids[from_variable], relationship, ids[to_variable])
+        elif re.match(r'\s*CREATE\b', command, re.IGNORECASE):
+            # A CREATE that cannot be turned into upserts would add its nodes again on every run, without repo or file
+            print(f"Dropped graph command (cannot be upserted): {command}")
+        else:
+            graph_writer.add_statement(merge_relationship(command))
+    # Link related files to the uploaded file
     for file_path in file_paths:
-        if file_path:
-            neptune_graph.execute_query(
-                graphIdentifier=neptune_graph_id,
-                queryString=f"""
-                MATCH (a:File {{name: "{code_file}"}})
-                MATCH (b:File {{name: "{file_path}"}})
-                MERGE (a)-[:RELATED_TO]->(b)
-                """,
-                language='opencypher'
-            )
+        graph_writer.add_edge(node_id(repo_url, path, ''), 'RELATED_TO', node_id(repo_url, repository_path(file_path, root), ''))
+    graph_writer.flush()
+    return True
 
-def process_repository(repo_url, ssh_url=None):
+def process_file(file_path, repo_url, branch, sync_job_id, document_ids=None, root='repositories/', data_source_id=None):
+    """
+    Generate documentation for a single file and upload it to the index.
+    document_ids are given when resuming a file whose documentation was uploaded before the job was interrupted,
+    only its graph is generated then.
+    Returns the IDs of the uploaded documents and the stages that succeeded, or None once all attempts failed.
+    """
+    # The file duration includes its retries and its graph
+    started = time.perf_counter()
+    for attempt in range(3):
+        try:
+            if document_ids is None:
+                print(f"\033[92mProcessing file: {file_path}\033[0m")
+                code = open(file_path, 'r')
+                code_text = code.read()
+                code.close()
+                chunks = chunk_code(code_text, file_path, max_chunk_tokens)
+                if len(chunks) > 1:
+                    print(f"Split {file_path} into {len(chunks)} chunks")
+                # Every prompt of every chunk is sent at the same time, with the prompt cache once the first prompt wrote it
+                requests = [
+                    (prompt, f"{chunk.start_line}-{chunk.end_line}" if len(chunks) > 1 else None, chunk.text)
+                    for chunk in chunks
+                    for prompt in PROMPTS
+                ]
+                if prompt_mode in ('combined', 'compare'):
+                    # One completion per chunk, its answers follow the order of requests
+                    chunk_answers = prompt_executor.map(
+                        lambda chunk: combined_completion(
+                            chunk.text, file_path, f"{chunk.start_line}-{chunk.end_line}" if len(chunks) > 1 else None
+                        ),
+                        chunks
+                    )
+                if prompt_mode != 'combined' and prompt_caching == 'true':
+                    separate_answers = cached_prompt_answers(requests, file_path)
+                elif prompt_mode != 'combined':
+                    formatted_prompts = [format_prompt(prompt, text, file_path, lines) for prompt, lines, text in requests]
+                    stages = [PROMPT_STAGES[PROMPTS.index(prompt)] for prompt, lines, text in requests]
+                    separate_answers = prompt_executor.map(
+                        lambda formatted_prompt, stage: bedrock_completion(formatted_prompt, stage=stage), formatted_prompts, stages
+                    )
+                # Wait for every completion before uploading anything for the file
+                if prompt_mode == 'combined':
+                    answers = [answer for answers_of_chunk in chunk_answers for answer in answers_of_chunk]
+                else:
+                    answers = list(separate_answers)
+                if prompt_mode == 'compare':
+                    combined_answers = [answer for answers_of_chunk in chunk_answers for answer in answers_of_chunk]
+                    compare_answers(file_path, requests, answers, combined_answers)
+                uploaded_ids = []
+                for (prompt, lines, text), answer in zip(requests, answers):
+                    uploaded_ids.append(upload_prompt_answer_and_file_name(
+                        file_path, prompt, answer, repo_url, branch, sync_job_id, lines, root, data_source_id
+                    ))
+                # Upload the file itself to the index
+                uploaded_ids.append(upload_prompt_answer_and_file_name(
+                    file_path, "", code_text, repo_url, branch, sync_job_id, root=root, data_source_id=data_source_id
+                ))
+                # Save the answers to a file
+                # save_answers('\n'.join(answers), file_path, "documentation/")
+                document_ids = uploaded_ids
+            stages = ['documents']
+            # Add nodes and edges to the graph
+            if enable_graph == 'true' and graph_extractor == 'llm':
+                try:
+                    with metrics.timer('graph'):
+                        if add_graph_nodes_and_edges(file_path, repo_url, root):
+                            stages.append('graph')
+                except Exception as e:
+                    # A failed graph step does not reprocess the documentation of the file,
+                    # it is not checkpointed so a restarted job generates it again
+                    print(f"Graph error for {file_path}: {e}")
+            metrics.record('file', time.perf_counter() - started)
+            return document_ids, stages
+        except Exception as e:
+            print(f"Error: {e}")
+            # Requests are already retried on throttling, so only retry the file on transient errors.
+            # Permanent errors, i.e. a file that cannot be decoded, would fail the same way again.
+            if not is_retryable_error(e):
+                break
+            metrics.increment('file_retries')
+            time.sleep(15)
+    print(f"\033[93mSkipping file: {file_path}\033[0m")
+    metrics.record('file', time.perf_counter() - started)
+    return None
 
-    sync_job_id = amazon_q.start_data_source_sync_job(
-        applicationId=amazon_q_app_id,
-        dataSourceId=q_app_data_source_id,
-        indexId=index_id
-    )['executionId']
+def checkout_repository(repo_url, ssh_url, destination_folder):
+    """Clone the repository, with the SSH key when an SSH URL is given, into a clean destination folder."""
+    # The repository is cloned straight into the folder the files are processed from
+    if os.path.exists(destination_folder):
+        shutil.rmtree(destination_folder)
+    print(f"Cloning repository... {repo_url}")
+    with metrics.timer('clone'):
+        if ssh_url:
+            ssh_key = get_ssh_key(ssh_key_name)
+            ssh_key_file = write_ssh_key_to_tempfile(ssh_key)
+            ssh_command = f"ssh -i {ssh_key_file} -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
+            repo = clone_repository(ssh_url, destination_folder, env={"GIT_SSH_COMMAND": ssh_command})
+        else:
+            repo = clone_repository(repo_url, destination_folder)
+    print(f"Finished cloning repository {repo_url}")
+    return repo
 
-    # Temporary clone location
-    tmp_dir = f"/tmp/{datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')}" 
+def exports_graph():
+    """Whether the static graph is exported to GRAPH_EXPORT_LOCATION instead of written with queries."""
+    if not graph_export_location:
+        return False
+    if graph_import_role_arn and graph_export_location.startswith('s3://'):
+        # Import tasks only load into an empty graph, i.e. the first run of the stack
+        return GraphWriter(neptune_graph, neptune_graph_id, embedding_service, neptune_limiter, metrics).is_empty()
+    return True
 
-    destination_folder = 'repositories/'
+def write_static_graph(repo_url, destination_folder, file_paths, export=False):
+    """Extract the graph of the given files with static analysis and write, or export when export is set, it."""
+    # The graph of the whole repository is extracted at once, so calls and imports across files resolve
+    with metrics.timer('static_graph.extract'):
+        graph = build_graph(destination_folder, file_paths)
+    if export:
+        nodes, edges = write_graph(graph, GraphExporter(graph_export_location, embedding_service), repo_url, graph_embedded_labels)
+        print(f"Graph: {nodes} nodes and {edges} edges exported to {graph_export_location}")
+        if graph_import_role_arn and graph_export_location.startswith('s3://'):
+            start_import(get_client('neptune-graph'), neptune_graph_id, graph_export_location, graph_import_role_arn)
+    else:
+        graph_writer = GraphWriter(neptune_graph, neptune_graph_id, embedding_service, neptune_limiter, metrics)
+        with metrics.timer('static_graph.write'):
+            nodes, edges = write_graph(graph, graph_writer, repo_url, graph_embedded_labels)
+        # Symbols removed from the extracted files are deleted from the graph
+        extracted_paths = [os.path.relpath(file_path, destination_folder) for file_path in file_paths]
+        graph_writer.prune(repo_url, extracted_paths, keep_ids=graph_node_ids(graph, repo_url))
+        print(f"Graph: {nodes} nodes and {edges} edges written in {graph_writer.queries} queries")
 
-    if not os.path.exists(destination_folder):
-        os.makedirs(destination_folder)
+def process_repository(repo_url, ssh_url=None, destination_folder='repositories/', data_source_id=None):
+    """
+    Ingest one repository: document its files, write its graph and save its manifest.
+    Args:
+        repo_url (str): The repository URL.
+        ssh_url (str): Optional SSH URL the repository is cloned from.
+        destination_folder (str): The folder the repository is cloned to.
+        data_source_id (str): The data source the documents are uploaded to, Q_APP_DATA_SOURCE_ID by default.
+    Returns:
+        processed_files (list), failed_files (list): The names of the processed files and the paths of the failed ones.
+    """
+    data_source_id = data_source_id or q_app_data_source_id
+    # Each shard of an array job has its own checkpoint and writes its own manifest, merged by the reduce step.
+    # A job ingesting several repositories keeps them per repository.
+    sharded = shard_count > 1
+    repository_manifest_location = manifest_location
+    repository_checkpoint_location = checkpoint_location
+    if repositories_location:
+        repository_manifest_location = repository_location(manifest_location, repo_url)
+        repository_checkpoint_location = repository_location(checkpoint_location, repo_url)
+    if sharded:
+        repository_checkpoint_location = shard_location(checkpoint_location, shard_index)
+    checkpoint = Checkpoint(repository_checkpoint_location, repo_url, checkpoint_interval)
+    # The sync job of a sharded run is started by the submit Lambda and stopped by the reduce step
+    if sharded:
+        files = ingest_repository(repo_url, ssh_url, destination_folder, data_source_id, shared_sync_job_id, checkpoint, repository_manifest_location)
+        document_writer.flush()
+        return files
+    # A restarted job keeps uploading to the sync job of the interrupted run
+    sync_job_id = sync_jobs.start(data_source_id, checkpoint.sync_job_id)
+    if sync_job_id != checkpoint.sync_job_id:
+        checkpoint.set_sync_job_id(sync_job_id)
+    try:
+        return ingest_repository(repo_url, ssh_url, destination_folder, data_source_id, sync_job_id, checkpoint, repository_manifest_location)
+    except Exception:
+        # The sync job is stopped below, so a retried job must start a new one
+        document_writer.flush()
+        checkpoint.set_sync_job_id(None)
+        raise
+    finally:
+        # Other repositories may share the sync job, it is stopped when the last of them finished
+        sync_jobs.stop(data_source_id)
 
-    # Clone the repository
-    print(f"Cloning repository... {repo_url}")
-    if ssh_url:
-        ssh_key = get_ssh_key(ssh_key_name)
-        ssh_key_file = write_ssh_key_to_tempfile(ssh_key)
-        ssh_command = f"ssh -i {ssh_key_file} -o UserKnownHostsFile=/dev/null -o StrictHostKeyChecking=no"
-        repo = git.Repo.clone_from(ssh_url, tmp_dir, env={"GIT_SSH_COMMAND": ssh_command})
-        branch = repo.active_branch
-        print(f"Active Branch Name: {branch}")
-    else:
-        repo = git.Repo.clone_from(repo_url, tmp_dir)
-        branch = repo.active_branch
-        print(f"Active Branch Name: {branch}")
-    print(f"Finished cloning repository {repo_url}")
-    # Copy all files to destination folder
-    for src_dir, dirs, files in os.walk(tmp_dir):
-        dst_dir = src_dir.replace(tmp_dir, destination_folder)
-        if not os.path.exists(dst_dir):
-            os.mkdir(dst_dir)
-        for file_ in files:
-            src_file = os.path.join(src_dir, file_)
-            dst_file = os.path.join(dst_dir, file_)
-            if os.path.exists(dst_file):
-                os.remove(dst_file)
-            shutil.copy(src_file, dst_dir)
-    
-    # Delete temp clone       
-    shutil.rmtree(tmp_dir)
-
-    import time
+def ingest_repository(repo_url, ssh_url, destination_folder, data_source_id, sync_job_id, checkpoint, repository_manifest_location):
+    """Clone a repository and process its files within a running sync job."""
+    sharded = shard_count > 1
+    shard_manifest_location = shard_location(repository_manifest_location, shard_index) if sharded else repository_manifest_location
+    repo = checkout_repository(repo_url, ssh_url, destination_folder)
+    branch = repo.active_branch
+    print(f"Active Branch Name: {branch}")
+    commit = repo.head.commit.hexsha
+    blobs = tree_blobs(repo)
 
     processed_files = []
+    # Paths of the processed files, the static graph is only extracted from them
+    processed_paths = []
     failed_files = []
-    print(f"Processing files in {destination_folder}")
-    for root, dirs, files in os.walk(destination_folder):
-        if should_ignore_path(root):
+    manifest = load_manifest(repository_manifest_location, repo_url)
+    if sharded:
+        print(f"Processing shard {shard_index} of {shard_count}")
+        manifest['files'] = {path: entry for path, entry in manifest['files'].items() if shard_of(path, shard_count) == shard_index}
+        blobs = {path: blob for path, blob in blobs.items() if shard_of(path, shard_count) == shard_index}
+    changed, removed = diff_manifest(manifest, blobs)
+    print(f"Changes since commit {manifest['commit']}: {len(changed)} added or modified and {len(removed)} removed files")
+    # Delete the documents of files that no longer exist
+    for path in removed:
+        removed_ids = manifest['files'].pop(path)['documents']
+        if not checkpoint.finished_stage('removed'):
+            document_writer.delete(removed_ids, sync_job_id)
+    # And their graph nodes, unless the graph is exported instead of written
+    export = enable_graph == 'true' and graph_extractor == 'static' and exports_graph()
+    if enable_graph == 'true' and removed and not export and not checkpoint.finished_stage('removed'):
+        GraphWriter(neptune_graph, neptune_graph_id, embedding_service, neptune_limiter, metrics).prune(repo_url, removed)
+    if not checkpoint.finished_stage('removed'):
+        checkpoint.finish_stage('removed')
+
+    print(f"Processing files in {destination_folder} with {max_workers} workers")
+    discovery = FileDiscovery(include_globs, exclude_globs, max_file_bytes)
+    started = time.time()
+    # Files are submitted while the tree is still being walked.
+    # Results are collected in walk order so the reported lists match a serial run.
+    futures = []
+    resumed_files = 0
+    walk_started = time.perf_counter()
+    for file_path in discovery.discover(destination_folder):
+        path = os.path.relpath(file_path, destination_folder)
+        if sharded and shard_of(path, shard_count) != shard_index:
             continue
-        for file in files:
-            if file.endswith(('.png', '.jpg', '.jpeg', '.gif', '.zip', '.pyc')):
-                continue
-            # Ignore files that start with a dot (.)
-            if file.startswith('.'):
-                continue
-                
-            file_path = os.path.join(root, file)
-            
-            for attempt in range(3):
-                try:
-                    prompts = [
-                        "Come up with a list of questions and answers about the attached file. Keep answers dense with information. A good question for a database related file would be 'What is the database technology and architecture?' or for a file that executes SQL commands 'What are the SQL commands and what do they do?' or for a file that contains a list of API endpoints 'What are the API endpoints and what do they do?'",
-                        "Generate comprehensive documentation about the attached file. Make sure you include what dependencies and other files are being referenced as well as function names, class names, and what they do.",
-                        "Identify anti-patterns in the attached file. Make sure to include examples of how to fix them. Try Q&A like 'What are some anti-patterns in the file?' or 'What could be causing high latency?'",
-                        "Suggest improvements to the attached file. Try Q&A like 'What are some ways to improve the file?' or 'Where can the file be optimized?'"
-                    ]
-                    answers = []
-                    print(f"\033[92mProcessing file: {file_path}\033[0m")
-                    code = open(file_path, 'r')
-                    code_text = code.read()
-                    code.close()
-                    for prompt in prompts:
-                        formatted_prompt = format_prompt(prompt, code_text, file_path)
-                        answer = bedrock_completion(formatted_prompt)
-                        upload_prompt_answer_and_file_name(file_path, prompt, answer, repo_url, branch, sync_job_id)
-                        answers.append(answer)
-                    # Upload the file itself to the index
-                    upload_prompt_answer_and_file_name(file_path, "", code_text, repo_url, branch, sync_job_id)
-                    # Save the answers to a file
-                    # save_answers('\n'.join(answers), file_path, "documentation/")
-                    # Add nodes and edges to the graph
-                    if enable_graph == 'true':
-                        add_graph_nodes_and_edges(file_path)
-                    processed_files.append(file)
-                    break
-                except Exception as e:
-                    print(f"Error: {e}")
-                    time.sleep(15)
-            else:
-                print(f"\033[93mSkipping file: {file_path}\033[0m")
+        if incremental == 'true' and path not in changed:
+            continue
+        finished = checkpoint.finished_file(path, blobs.get(path))
+        if finished and set(file_stages) <= set(finished['stages']):
+            # Finished before the job was interrupted
+            resumed_files += 1
+            future = Future()
+            future.set_result((finished['documents'], finished['stages']))
+        else:
+            document_ids = finished['documents'] if finished else None
+            future = file_executor.submit(
+                process_file, file_path, repo_url, branch, sync_job_id, document_ids, destination_folder, data_source_id
+            )
+        futures.append((file_path, future))
+    metrics.record('walk', time.perf_counter() - walk_started)
+    if resumed_files:
+        print(f"Resumed {resumed_files} files finished before the job was interrupted")
+    # Files are only checkpointed and added to the manifest once their documents were uploaded
+    uploading = []
+
+    def finish_uploaded_files():
+        document_writer.flush()
+        for file_path, document_ids, stages in uploading:
+            if document_writer.failed(document_ids):
+                # Keeps its previous manifest entry, so the next run uploads it again
                 failed_files.append(file_path)
-                
+                continue
+            processed_files.append(os.path.basename(file_path))
+            processed_paths.append(file_path)
+            path = os.path.relpath(file_path, destination_folder)
+            checkpoint.finish_file(path, blobs.get(path), document_ids, stages)
+            previous = manifest['files'].get(path, {})
+            # Delete documents the file no longer produces
+            stale_ids = set(previous.get('documents', [])) - set(document_ids)
+            if stale_ids:
+                document_writer.delete(stale_ids, sync_job_id)
+            manifest['files'][path] = {'blob': blobs.get(path), 'documents': document_ids}
+        uploading.clear()
+
+    for file_path, future in futures:
+        result = future.result()
+        if result is None:
+            failed_files.append(file_path)
+            continue
+        document_ids, stages = result
+        uploading.append((file_path, document_ids, stages))
+        if checkpoint.due():
+            finish_uploaded_files()
+            checkpoint.save()
+
+    finish_uploaded_files()
+    checkpoint.save()
+
+    # A sharded run writes the static graph of the whole repository in the reduce step
+    if enable_graph == 'true' and graph_extractor == 'static' and shard_count == 1 and not checkpoint.finished_stage('graph'):
+        write_static_graph(repo_url, destination_folder, processed_paths, export)
+        checkpoint.finish_stage('graph')
+
+    print(f"Repository {repo_url} finished in {time.time() - started:.0f}s")
     print(f"Processed files: {processed_files}")
     print(f"Failed files: {failed_files}")
-    # Stop data source sync
+    print(f"Skipped files: {dict(discovery.skipped)}")
+    # Failed files keep their previous entry so the next run processes them again
+    manifest['commit'] = commit
+    save_manifest(shard_manifest_location, manifest)
+    # The run completed, the next one starts from the manifest
+    checkpoint.clear()
+    return processed_files, failed_files
+
+def process_repositories(repositories):
+    """
+    Ingest several repositories in one job. Their files go through the same file workers and rate limiters,
+    and each repository has its own manifest, checkpoint and report.
+    Args:
+        repositories (list): Dicts with repo_url, ssh_url and data_source_id, see load_repositories.
+    """
+    if shard_count > 1 or graph_export_location:
+        raise ValueError("Sharding and graph export are only supported for a single repository")
+    print(f"Processing {len(repositories)} repositories, {repository_concurrency} at a time")
+    failed_repositories = []
+    # Repository threads only clone and wait for the file workers, so they do not count against MAX_WORKERS
+    with ThreadPoolExecutor(max_workers=repository_concurrency) as repository_executor:
+        futures = []
+        for repository in repositories:
+            destination_folder = f"repositories/{repository_key(repository['repo_url'])}/"
+            futures.append((repository, repository_executor.submit(
+                process_repository, repository['repo_url'], repository['ssh_url'], destination_folder, repository['data_source_id']
+            )))
+        for repository, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                # One failed repository does not stop the others
+                print(f"\033[93mFailed repository {repository['repo_url']}: {e}\033[0m")
+                failed_repositories.append(repository['repo_url'])
+    print(f"Processed {len(repositories) - len(failed_repositories)} repositories, failed: {failed_repositories}")
+
+def report_totals():
+    print(f"Failed documents: {document_writer.failed_documents}")
+    print(f"BatchPutDocument calls: {document_writer.put_calls}")
+    print(f"LLM cache hits: {llm_cache.hits}, misses: {llm_cache.misses}")
+    print(f"Embedding cache hits: {embedding_service.hits}, misses: {embedding_service.misses}")
+    for limiter in [bedrock_limiter, embedding_limiter, amazon_q_limiter, neptune_limiter]:
+        print(f"{limiter.name} throttles: {limiter.throttles}, retries: {limiter.retries}, final rate: {limiter.rate:.1f}/s")
+    if prompt_mode == 'compare' and prompt_comparisons:
+        save_prompt_comparison()
+    report_metrics()
+
+def report_metrics():
+    """Print the per stage percentiles and counters of the run as JSON, and save them when METRICS_LOCATION is set."""
+    summary = metrics.summary()
+    counters = summary['counters']
+    counters['llm_cache_hits'] = llm_cache.hits
+    counters['llm_cache_misses'] = llm_cache.misses
+    counters['embedding_cache_hits'] = embedding_service.hits
+    counters['embedding_cache_misses'] = embedding_service.misses
+    counters['put_calls'] = document_writer.put_calls
+    counters['failed_documents'] = len(document_writer.failed_documents)
+    for limiter in [bedrock_limiter, embedding_limiter, amazon_q_limiter, neptune_limiter]:
+        name = limiter.name.lower().replace(' ', '_')
+        counters[f"{name}_throttles"] = limiter.throttles
+        counters[f"{name}_retries"] = limiter.retries
+    print(json.dumps(summary))
+    if metrics_location:
+        # Every shard and the reduce step of a sharded run save their own summary
+        location = metrics_location
+        if shard_count > 1:
+            location = shard_location(metrics_location, 'reduce' if ingestion_mode == 'reduce' else shard_index)
+        save_summary(location, summary)
+    if metrics_emf == 'true':
+        dimensions = {'Repository': repo_url} if repo_url and not repositories_location else {}
+        for line in metrics.emf_lines(metrics_namespace, dimensions, summary):
+            print(line)
+
+def failed_shard_location(index):
+    return shard_location(manifest_location, f"{index}-failed")
+
+def fail_shard(error):
+    """Record the failure of the last attempt of a shard, so the reduce job still runs and stops the sync job."""
+    print(f"\033[93mShard {shard_index} failed on its last attempt: {error}\033[0m")
+    # The documents uploaded so far are kept, the shard has no manifest so the next run processes its files again
+    document_writer.flush()
+    storage.write(failed_shard_location(shard_index), json.dumps({'shard': shard_index, 'error': str(error)}).encode('utf-8'))
+
+def reduce_shards(repo_url, ssh_url=None):
+    """
+    Finish a sharded run once every shard of the array job completed: merge the shard manifests,
+    write the static graph of the whole repository and stop the sync job.
+    """
+    manifest = load_manifest(manifest_location, repo_url)
+    shard_manifests = []
+    for index in range(shard_count):
+        shard_manifest = load_manifest(shard_location(manifest_location, index), repo_url)
+        # A shard that did not finish has not written its manifest
+        shard_manifests.append(shard_manifest if shard_manifest['commit'] else None)
+        failure = storage.read(failed_shard_location(index))
+        if failure is not None:
+            print(f"\033[93mShard {index} failed: {json.loads(failure)['error']}\033[0m")
+            storage.delete(failed_shard_location(index))
+    merged = merge_shard_manifests(manifest, shard_manifests, shard_count)
+    if enable_graph == 'true' and graph_extractor == 'static':
+        destination_folder = 'repositories/'
+        repo = checkout_repository(repo_url, ssh_url, destination_folder)
+        blobs = tree_blobs(repo)
+        changed, removed = diff_manifest(manifest, blobs)
+        discovery = FileDiscovery(include_globs, exclude_globs, max_file_bytes)
+        # Files a shard failed keep their previous blob in the merged manifest, they are not extracted
+        processed = {path for path, entry in merged['files'].items() if entry['blob'] == blobs.get(path)}
+        file_paths = [
+            file_path for file_path in discovery.discover(destination_folder)
+            if os.path.relpath(file_path, destination_folder) in processed
+            and (incremental != 'true' or os.path.relpath(file_path, destination_folder) in changed)
+        ]
+        write_static_graph(repo_url, destination_folder, file_paths, exports_graph())
+    save_manifest(manifest_location, merged)
+    for index in range(shard_count):
+        delete_manifest(shard_location(manifest_location, index))
+    print(f"Merged the manifests of {shard_count} shards: {len(merged['files'])} files")
     amazon_q.stop_data_source_sync_job(
         applicationId=amazon_q_app_id,
         dataSourceId=q_app_data_source_id,
@@ -0,0 +1,214 @@
+import csv
+import json
+import os
+import sys
+import time
+from aws_clients import get_client
+from collections import defaultdict
+from storage import split_s3_location
+
+# Neptune Analytics CSV types of the property columns, by Python type
+CSV_TYPES = {bool: 'Bool', int: 'Int', float: 'Double', str: 'String'}
+VERTICES_FILE = 'vertices.csv'
+EDGES_FILE = 'edges.csv'
+# Vector components are separated by ; in a single cell
+VECTOR_SEPARATOR = ';'
+
+def csv_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        # Lists, i.e. base classes, are kept as JSON text
+        return json.dumps(value)
+    return value
+
+def csv_type(value):
+    return CSV_TYPES.get(type(value), 'String')
+
+class GraphExporter:
+    """A class to write the graph to Neptune Analytics bulk import CSV files instead of running queries.
+    It takes the same nodes and edges as GraphWriter."""
+
+    def __init__(self, location, embedding_service=None):
+        """Initialize GraphExporter for the given output location.
+
+        Args:
+            location (str): A local directory or an s3://bucket/prefix/ the CSV files are written to.
+            embedding_service (EmbeddingService): Optional, embeds the text attached to the nodes into an embedding column.
+        """
+        self.location = location
+        self.embedding_service = embedding_service
+        self.nodes = {}
+        self.edges = defaultdict(list)
+
+    def add_node(self, node_id, label, properties, embedding_text=None):
+        self.nodes[node_id] = (label, properties, embedding_text)
+
+    def add_statement(self, statement):
+        raise ValueError("Arbitrary openCypher statements cannot be bulk loaded")
+
+    def add_edge(self, from_id, relationship, to_id):
+        self.edges[relationship].append((from_id, to_id))
+
+    def flush(self):
+        """
+        Write the vertices and edges files. Edges whose ends are not exported are left out,
+        the import fails on edges to missing vertices.
+        Returns:
+            (int, int): The number of vertices and edges written.
+        """
+        directory = self.location
+        if self.location.startswith('s3://'):
+            directory = 'graph_export/'
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        vertices = self._write_vertices(os.path.join(directory, VERTICES_FILE))
+        edges = self._write_edges(os.path.join(directory, EDGES_FILE))
+        if self.location.startswith('s3://'):
+            bucket, prefix = split_s3_location(self.location)
+            s3 = get_client('s3')
+            for name in (VERTICES_FILE, EDGES_FILE):
+                s3.upload_file(os.path.join(directory, name), bucket, prefix.rstrip('/') + '/' + name)
+        self.nodes = {}
+        self.edges.clear()
+        return vertices, edges
+
+    def _write_vertices(self, path):
+        columns = {}
+        for label, properties, embedding_text in self.nodes.values():
+            for key, value in properties.items():
+                if value is not None:
+                    columns.setdefault(key, csv_type(value))
+        texts = [embedding_text for label, properties, embedding_text in self.nodes.values() if embedding_text]
+        embeddings = {}
+        if self.embedding_service and texts:
+            embeddings = dict(zip(texts, self.embedding_service.embed_many(texts)))
+        header = ['~id', '~label'] + [f"{key}:{columns[key]}" for key in columns]
+        if embeddings:
+            header.append('embedding:Vector')
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for node_id, (label, properties, embedding_text) in self.nodes.items():
+                row = [node_id, label] + [csv_value(properties.get(key, '')) for key in columns]
+                if embeddings:
+                    embedding = embeddings.get(embedding_text)
+                    row.append(VECTOR_SEPARATOR.join(str(value) for value in embedding) if embedding else '')
+                writer.writerow(row)
+        return len(self.nodes)
+
+    def _write_edges(self, path):
+        count = 0
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['~id', '~from', '~to', '~label'])
+            for relationship, edges in self.edges.items():
+                for from_id, to_id in dict.fromkeys(edges):
+                    if from_id not in self.nodes or to_id not in self.nodes:
+                        continue
+                    writer.writerow([f"{from_id}-{relationship}->{to_id}", from_id, to_id, relationship])
+                    count += 1
+        return count
+
+def validate_export(directory):
+    """
+    Check the files written by GraphExporter before they are imported.
+    Args:
+        directory (str): The local directory of the CSV files.
+    Returns:
+        errors (list): A description of every problem found, empty when the files can be imported.
+    """
+    errors = []
+    vertex_ids = set()
+    dimensions = set()
+    with open(os.path.join(directory, VERTICES_FILE), newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if header[:2] != ['~id', '~label']:
+            errors.append(f"{VERTICES_FILE}: header must start with ~id,~label, got {header[:2]}")
+        types = [column.rpartition(':')[2] for column in header[2:]]
+        for line, row in enumerate(reader, start=2):
+            if len(row) != len(header):
+                errors.append(f"{VERTICES_FILE}:{line}: {len(row)} cells for {len(header)} columns")
+                continue
+            if row[0] in vertex_ids:
+                errors.append(f"{VERTICES_FILE}:{line}: duplicate id {row[0]}")
+            vertex_ids.add(row[0])
+            for column_type, value in zip(types, row[2:]):
+                if value == '':
+                    continue
+                try:
+                    if column_type == 'Int':
+                        int(value)
+                    elif column_type == 'Double':
+                        float(value)
+                    elif column_type == 'Bool' and value not in ('true', 'false'):
+                        raise ValueError(value)
+                    elif column_type == 'Vector':
+                        dimensions.add(len([float(component) for component in value.split(VECTOR_SEPARATOR)]))
+                except ValueError:
+                    errors.append(f"{VERTICES_FILE}:{line}: {value[:30]!r} is not a valid {column_type}")
+    if len(dimensions) > 1:
+        errors.append(f"{VERTICES_FILE}: embeddings have different dimensions {sorted(dimensions)}")
+    edge_ids = set()
+    with open(os.path.join(directory, EDGES_FILE), newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        if header != ['~id', '~from', '~to', '~label']:
+            errors.append(f"{EDGES_FILE}: header must be ~id,~from,~to,~label, got {header}")
+        for line, row in enumerate(reader, start=2):
+            if len(row) != 4:
+                errors.append(f"{EDGES_FILE}:{line}: {len(row)} cells for 4 columns")
+                continue
+            if row[0] in edge_ids:
+                errors.append(f"{EDGES_FILE}:{line}: duplicate id {row[0]}")
+            edge_ids.add(row[0])
+            for end in row[1:3]:
+                if end not in vertex_ids:
+                    errors.append(f"{EDGES_FILE}:{line}: unknown vertex {end}")
+    return errors
+
+def start_import(neptune_graph, graph_id, source, role_arn, poll_seconds=30):
+    """
+    Load the exported files with one Neptune Analytics import task and wait for it.
+    The import task only loads into an empty graph, so this is meant for the initial ingest.
+    Args:
+        neptune_graph: The neptune-graph client.
+        graph_id (str): The Neptune Analytics graph identifier.
+        source (str): The s3:// prefix of the CSV files.
+        role_arn (str): A role Neptune Analytics assumes to read the files.
+    Returns:
+        status (str): The final status of the task, SUCCEEDED.
+    Raises:
+        RuntimeError: When the task ended with any other status.
+    """
+    task = neptune_graph.start_import_task(
+        graphIdentifier=graph_id,
+        source=source,
+        format='CSV',
+        roleArn=role_arn,
+        failOnError=True
+    )
+    print(f"Started import task {task['taskId']} from {source}")
+    while True:
+        status = neptune_graph.get_import_task(taskIdentifier=task['taskId'])['status']
+        if status not in ('INITIALIZING', 'ANALYZING_DATA', 'IMPORTING', 'REPROVISIONING', 'ROLLING_BACK'):
+            print(f"Import task {task['taskId']}: {status}")
+            if status != 'SUCCEEDED':
+                raise RuntimeError(f"Import task {task['taskId']} from {source} ended with status {status}")
+            return status
+        time.sleep(poll_seconds)
+
+if __name__ == "__main__":
+    # Export the static graph of a local repository without embeddings and validate it:
+    # python graph_export.py <repository directory> <output directory>
+    from code_graph import build_graph, write_graph
+    from file_discovery import FileDiscovery
+    repository, output = sys.argv[1], sys.argv[2]
+    graph = build_graph(repository, FileDiscovery().discover(repository))
+    nodes, edges = write_graph(graph, GraphExporter(output), os.path.abspath(repository))
+    print(f"Extracted {nodes} nodes and {edges} edges, exported to {output}")
+    errors = validate_export(output)
+    for error in errors:
+        print(error)
+    sys.exit(1 if errors else 0)
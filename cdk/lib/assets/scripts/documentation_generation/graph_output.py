@@ -0,0 +1,44 @@
+import re
+from opencypher_parser import OpenCypherParseError, split_statements, validate_statement
+
+class GraphOutputError(ValueError):
+    pass
+
+def extract_tag(output, tag):
+    """Return the text between <tag> and </tag> in the model output, or None when the tag is missing."""
+    match = re.search(rf'<{tag}>(.*?)</{tag}>', output, re.DOTALL)
+    return match.group(1) if match else None
+
+def parse_graph_output(output):
+    """
+    Parse and validate the graph commands written by the model.
+    Only the model output is parsed, never the code it was given, so a <commands> literal in a file cannot be mistaken for them.
+    Args:
+        output (str): The text of the completion.
+    Returns:
+        statements (list): The statements that passed validation.
+        file_paths (list): The related file paths, stripped.
+        rejected (list): (statement, reason) of every dropped statement.
+    Raises:
+        GraphOutputError: When the output has no commands or none of them is valid, the graph step is worth retrying.
+    """
+    commands = extract_tag(output, 'commands')
+    if commands is None:
+        raise GraphOutputError("No <commands> in the output")
+    try:
+        candidates = split_statements(commands)
+    except OpenCypherParseError as e:
+        raise GraphOutputError(f"Commands do not parse: {e}")
+    statements = []
+    rejected = []
+    for statement in candidates:
+        try:
+            validate_statement(statement)
+        except OpenCypherParseError as e:
+            rejected.append((statement, str(e)))
+            continue
+        statements.append(statement)
+    if not statements:
+        raise GraphOutputError(f"None of the {len(candidates)} commands is valid")
+    file_paths = [line.strip() for line in (extract_tag(output, 'file_paths') or '').splitlines() if line.strip()]
+    return statements, file_paths, rejected
@@ -0,0 +1,132 @@
+import json
+import time
+from collections import defaultdict
+from opencypher_parser import quote_name
+
+# Rows sent in one UNWIND query
+MAX_ROWS_PER_QUERY = 500
+
+def batches(rows, size=MAX_ROWS_PER_QUERY):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+class GraphWriter:
+    """A class to collect nodes, edges and embeddings and write them to Neptune Analytics
+    in batched, parameterized openCypher queries."""
+
+    def __init__(self, neptune_graph, graph_id, embedding_service, limiter=None, metrics=None):
+        """Initialize GraphWriter for the given graph.
+
+        Args:
+            neptune_graph: The neptune-graph client.
+            graph_id (str): The Neptune Analytics graph identifier.
+            embedding_service (EmbeddingService): Embeds the text attached to the nodes.
+            limiter (AdaptiveRateLimiter): Optional rate limiter the queries go through.
+            metrics (Metrics): Optional, records the duration of every query.
+        """
+        self.neptune_graph = neptune_graph
+        self.graph_id = graph_id
+        self.embedding_service = embedding_service
+        self.limiter = limiter
+        self.metrics = metrics
+        self.nodes = defaultdict(list)
+        self.edges = defaultdict(list)
+        self.statements = []
+        self.embeddings = []
+        self.queries = 0
+
+    def add_node(self, node_id, label, properties, embedding_text=None):
+        """Queue a node upsert by its stable ID. Its embedding_text, if any, is embedded and upserted as the node vector."""
+        self.nodes[label].append({'id': node_id, 'properties': properties})
+        if embedding_text:
+            self.embeddings.append((node_id, embedding_text))
+
+    def add_statement(self, statement):
+        """Queue a statement that cannot be batched. It runs after the queued nodes are created,
+        and if it returns an id, the statement is embedded as the vector of that node."""
+        self.statements.append(statement)
+
+    def add_embedding(self, node_id, embedding_text):
+        """Queue the vector of a node that already exists in the graph."""
+        self.embeddings.append((node_id, embedding_text))
+
+    def add_edge(self, from_id, relationship, to_id):
+        """Queue an edge between two nodes by their IDs. Edges to missing nodes are skipped."""
+        self.edges[relationship].append({'from': from_id, 'to': to_id})
+
+    def execute(self, query, parameters=None):
+        """
+        Run one openCypher query.
+        Args:
+            query (str): The query text, without any literal data.
+            parameters (dict): The values referenced by $name in the query.
+        Returns:
+            results (list): The rows returned by the query.
+        """
+        kwargs = {'parameters': parameters} if parameters else {}
+        request = dict(graphIdentifier=self.graph_id, queryString=query, language='opencypher', **kwargs)
+        self.queries += 1
+        start = time.perf_counter()
+        if self.limiter is None:
+            r = self.neptune_graph.execute_query(**request)
+        else:
+            r = self.limiter.call(self.neptune_graph.execute_query, **request)
+        results = json.loads(r['payload'].read().decode('utf-8')).get('results', [])
+        if self.metrics:
+            self.metrics.record('neptune_query', time.perf_counter() - start)
+            self.metrics.increment('neptune_bytes_sent', len(query) + len(json.dumps(parameters or {})))
+        return results
+
+    def is_empty(self):
+        """Whether the graph has no node yet, the only graph an import task loads into."""
+        return not self.execute("MATCH (n) RETURN id(n) AS id LIMIT 1")
+
+    def flush(self):
+        """Write the queued nodes and statements, then the vectors, then the edges."""
+        for label, nodes in self.nodes.items():
+            for batch in batches(nodes):
+                # MERGE on the stable ID, so writing a node again updates it instead of adding a duplicate
+                self.execute(
+                    f"UNWIND $nodes AS node MERGE (n:{quote_name(label)} {{`~id`: node.id}}) SET n += node.properties",
+                    {'nodes': batch}
+                )
+        self.nodes.clear()
+        for statement in self.statements:
+            results = self.execute(statement)
+            if results and 'id' in results[0]:
+                self.embeddings.append((results[0]['id'], statement))
+        self.statements = []
+        if self.embeddings:
+            vectors = self.embedding_service.embed_many([text for node_id, text in self.embeddings])
+            rows = [{'id': node_id, 'embedding': vector} for (node_id, text), vector in zip(self.embeddings, vectors)]
+            for batch in batches(rows):
+                # The vectors are sent as parameters instead of literals in the query text
+                self.execute(
+                    "UNWIND $rows AS row MATCH (n) WHERE id(n) = row.id "
+                    "CALL neptune.algo.vectors.upsert(n, row.embedding) YIELD success "
+                    "RETURN count(success) AS upserted",
+                    {'rows': batch}
+                )
+            self.embeddings = []
+        for relationship, edges in self.edges.items():
+            for batch in batches(edges):
+                self.execute(
+                    "UNWIND $edges AS edge MATCH (a) WHERE id(a) = edge.from MATCH (b) WHERE id(b) = edge.to "
+                    f"MERGE (a)-[:{quote_name(relationship)}]->(b)",
+                    {'edges': batch}
+                )
+        self.edges.clear()
+
+    def prune(self, repo, paths, keep_ids=None):
+        """
+        Delete the nodes owned by files, by their file property, and their edges.
+        Args:
+            repo (str): The repository the nodes belong to.
+            paths (list): The files, relative to the repository root.
+            keep_ids (list): Nodes of these files that are kept, i.e. the ones just written for a changed file.
+        """
+        for batch in batches(list(paths)):
+            self.execute(
+                "UNWIND $paths AS path MATCH (n {repo: $repo, file: path}) WHERE NOT id(n) IN $keep DETACH DELETE n",
+                {'paths': batch, 'repo': repo, 'keep': list(keep_ids or [])}
+            )
@@ -0,0 +1,127 @@
+import json
+import os
+import storage
+from file_discovery import shard_of
+
+def empty_manifest(repo_url):
+    return {'repo_url': repo_url, 'commit': None, 'files': {}}
+
+def load_manifest(location, repo_url):
+    """
+    Load the manifest written by the previous run.
+    Args:
+        location (str): A local path or an s3://bucket/key URI.
+        repo_url (str): The repository the manifest belongs to.
+    Returns:
+        manifest (dict): The ingested commit SHA and, per file, its blob hash and document IDs.
+        An empty manifest is returned on the first run.
+    """
+    body = storage.read(location)
+    if body is None:
+        return empty_manifest(repo_url)
+    manifest = json.loads(body)
+    if manifest.get('repo_url') != repo_url:
+        print(f"Manifest at {location} belongs to {manifest.get('repo_url')}, ignoring it")
+        return empty_manifest(repo_url)
+    return manifest
+
+def save_manifest(location, manifest):
+    storage.write(location, json.dumps(manifest, indent=2).encode('utf-8'))
+
+def tree_blobs(repo):
+    """
+    List the blob hash of every file tracked at HEAD.
+    Args:
+        repo (git.Repo): The cloned repository.
+    Returns:
+        blobs (dict): Blob hashes keyed by path relative to the repository root.
+    """
+    blobs = {}
+    # -z keeps paths with special characters unquoted
+    for entry in repo.git.ls_tree('-r', '-z', 'HEAD').split('\0'):
+        if not entry:
+            continue
+        # <mode> SP <type> SP <object> TAB <file>
+        info, path = entry.split('\t', 1)
+        mode, object_type, blob = info.split()
+        if object_type == 'blob':
+            blobs[path] = blob
+    return blobs
+
+def diff_manifest(manifest, blobs):
+    """
+    Compare the previous manifest with the files at HEAD.
+    Blob hashes are compared instead of running git diff so shallow clones work.
+    Returns:
+        changed (set): Paths that were added or modified since the previous run.
+        removed (set): Paths that no longer exist.
+    """
+    previous = manifest['files']
+    changed = {path for path, blob in blobs.items() if previous.get(path, {}).get('blob') != blob}
+    removed = set(previous) - set(blobs)
+    return changed, removed
+
+def load_repositories(location):
+    """
+    Load the list of repositories a job ingests.
+    Args:
+        location (str): A JSON list, or a local path or an s3://bucket/key URI of one. Every item is a repository URL,
+        or an object with repo_url and the optional ssh_url and data_source_id.
+    Returns:
+        repositories (list): Dicts with repo_url, ssh_url and data_source_id (None when not set).
+    """
+    # The list is given inline when set from the stack parameter
+    body = location if location.lstrip().startswith('[') else storage.read(location)
+    if body is None:
+        raise FileNotFoundError(f"No list of repositories at {location}")
+    repositories = []
+    for item in json.loads(body):
+        if isinstance(item, str):
+            item = {'repo_url': item}
+        repositories.append({
+            'repo_url': item['repo_url'],
+            'ssh_url': item.get('ssh_url'),
+            'data_source_id': item.get('data_source_id'),
+        })
+    return repositories
+
+def repository_key(repo_url):
+    """Name a repository by its host and path, i.e. github.com/org/repo for https://github.com/org/repo.git."""
+    key = repo_url.split('://')[-1]
+    return key[:-4] if key.endswith('.git') else key
+
+def repository_location(location, repo_url):
+    """The location of a per-repository file when a job ingests several repositories, i.e. manifests/github.com/org/repo.json."""
+    root, extension = os.path.splitext(location)
+    return f"{root}/{repository_key(repo_url)}{extension}"
+
+def shard_location(location, shard_index):
+    """The location of the manifest written by one shard, i.e. manifests/repo.shard-0.json."""
+    root, extension = os.path.splitext(location)
+    return f"{root}.shard-{shard_index}{extension}"
+
+def delete_manifest(location):
+    storage.delete(location)
+
+def merge_shard_manifests(manifest, shard_manifests, shard_count):
+    """
+    Combine the manifests written by the shards of a run.
+    Args:
+        manifest (dict): The manifest of the previous run.
+        shard_manifests (list): The manifest of every shard, None for a shard that did not finish.
+        shard_count (int): The number of shards.
+    Returns:
+        manifest (dict): The files of every shard. A shard that did not finish keeps its files of the previous run,
+        so the next run processes them again.
+    """
+    merged = empty_manifest(manifest['repo_url'])
+    merged['commit'] = manifest['commit']
+    for shard_index, shard_manifest in enumerate(shard_manifests):
+        if shard_manifest is None:
+            print(f"Shard {shard_index} did not finish, keeping its files of the previous run")
+            files = {path: entry for path, entry in manifest['files'].items() if shard_of(path, shard_count) == shard_index}
+        else:
+            files = shard_manifest['files']
+            merged['commit'] = shard_manifest['commit']
+        merged['files'].update(files)
+    return merged
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from aws_clients import get_client
+from storage import split_s3_location
+
+def cache_key(model_id, body):
+    """
+    Address a completion by the content of its request.
+    Args:
+        model_id (str): The Bedrock model ID.
+        body (str): The request body, with the full prompt including the code text, and the settings of the
+        completion, i.e. max_tokens, stop_sequences and anthropic_version.
+    Returns:
+        str: The SHA-256 hex digest of the model ID and request body.
+    """
+    return hashlib.sha256(json.dumps([model_id, body]).encode('utf-8')).hexdigest()
+
+class SQLiteCacheBackend:
+    """A class to store completions in a local SQLite file with size-based LRU eviction."""
+
+    def __init__(self, path, max_bytes):
+        """Initialize SQLiteCacheBackend with the given database file.
+
+        Args:
+            path (str): The SQLite database file.
+            max_bytes (int): The least recently used entries are evicted above this size.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, value BLOB, size INTEGER, last_access REAL)"
+        )
+        self.connection.commit()
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self.connection.execute("UPDATE completions SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+            return row[0]
+
+    def put(self, key, value):
+        with self.lock:
+            row = self.connection.execute("SELECT size FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.total_bytes -= row[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time())
+            )
+            self.total_bytes += len(value)
+            # Evict the least recently used entries until the cache fits again
+            while self.total_bytes > self.max_bytes:
+                oldest = self.connection.execute(
+                    "SELECT key, size FROM completions ORDER BY last_access LIMIT 1"
+                ).fetchone()
+                if oldest is None:
+                    break
+                self.connection.execute("DELETE FROM completions WHERE key = ?", (oldest[0],))
+                self.total_bytes -= oldest[1]
+            self.connection.commit()
+
+class S3CacheBackend:
+    """A class to store completions as S3 objects so they survive the Batch container.
+    Eviction is left to an S3 lifecycle rule on the prefix."""
+
+    def __init__(self, bucket, prefix):
+        """Initialize S3CacheBackend with the given bucket and key prefix.
+
+        Args:
+            bucket (str): The S3 bucket.
+            prefix (str): The key prefix of the cache entries.
+        """
+        self.s3 = get_client('s3')
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")['Body'].read()
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key, value):
+        self.s3.put_object(Bucket=self.bucket, Key=f"{self.prefix}{key}", Body=value)
+
+class LLMCache:
+    """A class to cache model responses by a hash of the model ID and request body."""
+
+    def __init__(self, backend):
+        """Initialize LLMCache with the given storage backend.
+
+        Args:
+            backend: An object with get(key) and put(key, value) methods storing bytes.
+        """
+        self.backend = backend
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model_id, body):
+        """Return the cached response, or None on a miss."""
+        try:
+            value = self.backend.get(cache_key(model_id, body))
+        except Exception as e:
+            print(f"Error reading LLM cache: {e}")
+            value = None
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if value is None else json.loads(value)
+
+    def put(self, model_id, body, response):
+        # A cache failure must never fail the file
+        try:
+            self.backend.put(cache_key(model_id, body), json.dumps(response).encode('utf-8'))
+        except Exception as e:
+            print(f"Error writing LLM cache: {e}")
+
+def create_llm_cache(location, max_bytes):
+    """
+    Create a cache for the given location.
+    Args:
+        location (str): A local SQLite file or an s3://bucket/prefix/ URI.
+        max_bytes (int): The maximum size of a local cache.
+    Returns:
+        LLMCache: The cache.
+    """
+    if location.startswith('s3://'):
+        bucket, prefix = split_s3_location(location)
+        return LLMCache(S3CacheBackend(bucket, prefix))
+    return LLMCache(SQLiteCacheBackend(location, max_bytes))
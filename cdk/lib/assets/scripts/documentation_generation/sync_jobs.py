@@ -0,0 +1,59 @@
+import threading
+
+class SyncJobs:
+    """A class to share Q Business data source sync jobs between the repositories of a run.
+    A data source only runs one sync job at a time, so repositories uploading to the same
+    data source share it, and it is stopped once the last of them finished."""
+
+    def __init__(self, amazon_q, application_id, index_id, before_stop=None):
+        """Initialize SyncJobs for the given index.
+
+        Args:
+            amazon_q: The qbusiness client.
+            application_id (str): The Amazon Q application ID.
+            index_id (str): The index the data sources belong to.
+            before_stop (function): Called before a sync job is stopped, i.e. to upload the buffered documents.
+        """
+        self.amazon_q = amazon_q
+        self.application_id = application_id
+        self.index_id = index_id
+        self.before_stop = before_stop
+        self.lock = threading.Lock()
+        # Running sync job ID and number of repositories using it, by data source
+        self.jobs = {}
+
+    def start(self, data_source_id, sync_job_id=None):
+        """
+        Join the sync job of a data source, starting it when no repository uses it yet.
+        Args:
+            data_source_id (str): The data source the repository uploads to.
+            sync_job_id (str): The sync job of an interrupted run, reused instead of starting a new one.
+        Returns:
+            sync_job_id (str): The running sync job.
+        """
+        with self.lock:
+            if data_source_id not in self.jobs:
+                if sync_job_id is None:
+                    sync_job_id = self.amazon_q.start_data_source_sync_job(
+                        applicationId=self.application_id,
+                        dataSourceId=data_source_id,
+                        indexId=self.index_id
+                    )['executionId']
+                self.jobs[data_source_id] = [sync_job_id, 0]
+            self.jobs[data_source_id][1] += 1
+            return self.jobs[data_source_id][0]
+
+    def stop(self, data_source_id):
+        """Leave the sync job of a data source, it is stopped when no other repository uses it."""
+        with self.lock:
+            self.jobs[data_source_id][1] -= 1
+            if self.jobs[data_source_id][1] > 0:
+                return
+            del self.jobs[data_source_id]
+            if self.before_stop:
+                self.before_stop()
+            self.amazon_q.stop_data_source_sync_job(
+                applicationId=self.application_id,
+                dataSourceId=data_source_id,
+                indexId=self.index_id,
+            )
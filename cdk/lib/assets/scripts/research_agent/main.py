@@ -4,6 +4,7 @@ import pandas as pd
 from langchain import LLMChain, PromptTemplate
 from langchain.agents import Tool, AgentExecutor, LLMSingleActionAgent
 from langchain_aws import ChatBedrock
+from aws_clients import get_client
 from tools.bash_tool import BashTool
 from tools.file_tool import FileTool
 from tools.amazon_q_tool import AmazonQTool
@@ -76,6 +77,7 @@ agent_llm = ChatBedrock(
     model_kwargs={"temperature":TEMPERATURE}, 
     model_id=MODEL_ID,
     region_name="us-west-2",
+    client=get_client('bedrock-runtime', region_name="us-west-2"),
     callbacks=[cb],
 )
 
@@ -176,7 +178,8 @@ The goal we are trying to accomplish is the following: {goal}.
         llm=ChatBedrock(
             model_kwargs={"temperature":TEMPERATURE}, 
             model_id=MODEL_ID,
-            region_name="us-west-2"
+            region_name="us-west-2",
+            client=get_client('bedrock-runtime', region_name="us-west-2"),
         ),
         verbose=True, 
     )
@@ -250,7 +253,8 @@ def initialize_meta_chain():
         llm=ChatBedrock(
             model_kwargs={"temperature":TEMPERATURE}, 
             model_id=MODEL_ID,
-            region_name="us-west-2"
+            region_name="us-west-2",
+            client=get_client('bedrock-runtime', region_name="us-west-2"),
         ),
         prompt=meta_prompt, 
         verbose=True, 
@@ -273,7 +277,8 @@ def initialize_evaluation_chain():
         llm=ChatBedrock(
             model_kwargs={"temperature":TEMPERATURE}, 
             model_id=MODEL_ID,
-            region_name="us-west-2"
+            region_name="us-west-2",
+            client=get_client('bedrock-runtime', region_name="us-west-2"),
         ),
         prompt=evaluation_prompt, 
         verbose=True, 
@@ -1,9 +1,11 @@
 from langchain_aws import ChatBedrock
 from langchain_core.prompts import ChatPromptTemplate
 import json
-import boto3
 import os
 import uuid
+from aws_clients import get_client
+from embedding_service import EmbeddingService
+from opencypher_parser import parse_node_create, properties_node_id, merge_node_query, merge_relationship
 
 MODEL_ID = "anthropic.claude-3-opus-20240229-v1:0"
 TEMPERATURE = 0
@@ -17,9 +19,12 @@ graph_llm = ChatBedrock(
     model_kwargs={"temperature":TEMPERATURE}, 
     model_id=MODEL_ID,
     region_name="us-west-2",
+    client=get_client('bedrock-runtime', region_name="us-west-2"),
 )
-amazon_q = boto3.client('qbusiness')
-neptune_graph = boto3.client('neptune-graph')
+# Clients are created once and shared by every tool instance
+amazon_q = get_client('qbusiness')
+neptune_graph = get_client('neptune-graph')
+embedding_service = EmbeddingService(get_client('bedrock-runtime'), "amazon.titan-embed-text-v2:0")
 
 class AmazonQTool:
     """A class to encapsulate the functionality of writing to files."""
@@ -30,7 +35,7 @@ class AmazonQTool:
         Args:
             directory (str): The directory to write files in.
         """
-        self.amazon_q = boto3.client('qbusiness')
+        self.amazon_q = amazon_q
 
     def ask_question_about_repo(self,prompt):
         """Useful to ask a question about the repository.
@@ -69,11 +74,22 @@ class AmazonQTool:
         for command in commands:
             if (len(command) <= 1):
                 continue
+            # Nodes are upserted by an ID derived from their repository, path and name, and relationships merged,
+            # so running the same commands again does not duplicate them
+            node = parse_node_create(command)
+            if node:
+                label, properties = node
+                request = {
+                    'queryString': merge_node_query(label),
+                    'parameters': {'id': properties_node_id(label, properties), 'properties': properties}
+                }
+            else:
+                request = {'queryString': merge_relationship(command)}
             try:
                 r = neptune_graph.execute_query(
                     graphIdentifier=NEPTUNE_GRAPH_ID,
-                    queryString=command,
-                    language='opencypher'
+                    language='opencypher',
+                    **request
                 )
             except Exception as e:
                 return "Executed OpenCypher queries until this one.: " + command + " with error: " + str(e) + "######\n\n There's no need to rerun the previous queries only the one that failed and the one's after it."
@@ -87,16 +103,18 @@ class AmazonQTool:
                 # Get Embedding
                 # Upsert titan generated embedding for the node that was just created Expression: File {name: 'LexBedrockMessageProcessor.py', path: 'bedrock/knowledge-base-lex-langsmith/lambda/LexBedrockMessageProcessor.py'}
                 embedding = self.generate_embeddings(command)
-                query = f"""
-                MATCH (n{{`~id`: "{node_id}"}})
-                CALL neptune.algo.vectors.upsert(n, {str(embedding)})
-                YIELD node, embedding, success
-                RETURN node, embedding, success
+                # Stable IDs may contain quotes, so the ID and vector are passed as parameters
+                query = """
+                MATCH (n) WHERE id(n) = $id
+                CALL neptune.algo.vectors.upsert(n, $embedding)
+                YIELD success
+                RETURN success
                 """
                 try:
                     neptune_graph.execute_query(
                         graphIdentifier=NEPTUNE_GRAPH_ID,
                         queryString=query,
+                        parameters={'id': node_id, 'embedding': embedding},
                         language='opencypher'
                     )
                 except Exception as e:
@@ -164,28 +182,11 @@ class AmazonQTool:
         """
         Generate a vector of embeddings for a text input using Amazon Titan Embeddings G1 - Text on demand.
         Args:
-            model_id (str): The model ID to use.
-            body (str) : The request body to use.
+            body (str) : The text to embed.
         Returns:
-            response (JSON): The text that the model generated, token information, and the
-            reason the model stopped generating text.
+            embedding (list): The embedding, served from the cache when the text was embedded before.
         """
-
-        bedrock = boto3.client(service_name='bedrock-runtime')
-
-        accept = "application/json"
-        content_type = "application/json"
-        model_id = "amazon.titan-embed-text-v2:0"
-
-        response = bedrock.invoke_model(
-            body=json.dumps({
-                        "inputText": body
-                    }), modelId=model_id, accept=accept, contentType=content_type
-        )
-
-        response_body = json.loads(response.get('body').read())
-
-        return response_body['embedding']
+        return embedding_service.embed(body)
         
     def get_complete_answer(self, prompt):
         """Useful to get a complete answer to a prompt.
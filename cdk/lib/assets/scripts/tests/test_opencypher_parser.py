@@ -0,0 +1,113 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'common'))
+
+from opencypher_parser import (
+    OpenCypherParseError, parse_create_pattern, parse_node_create, split_statements, validate_statement
+)
+
+
+class ParseNodeCreateTest(unittest.TestCase):
+
+    def test_single_node(self):
+        self.assertEqual(
+            parse_node_create("CREATE (n:File {name: 'main.py', size: 3}) RETURN id(n) AS id"),
+            ('File', {'name': 'main.py', 'size': 3})
+        )
+
+    def test_braces_inside_strings(self):
+        self.assertEqual(
+            parse_node_create("CREATE (n:Function {name: 'f', body: '} {', tags: ['a', 'b']})"),
+            ('Function', {'name': 'f', 'body': '} {', 'tags': ['a', 'b']})
+        )
+
+    def test_path_create_is_not_a_single_node(self):
+        self.assertIsNone(parse_node_create("CREATE (a:Class {name:'A'})-[:DEFINES]->(b:Function {name:'f'})"))
+
+    def test_multi_node_create_is_not_a_single_node(self):
+        self.assertIsNone(parse_node_create("CREATE (a:X {name:'a'}), (b:Y {name:'b'})"))
+
+    def test_return_of_another_variable(self):
+        self.assertIsNone(parse_node_create("CREATE (n:File {name: 'main.py'}) RETURN id(m)"))
+
+
+class ParseCreatePatternTest(unittest.TestCase):
+
+    def test_single_node(self):
+        self.assertEqual(
+            parse_create_pattern("CREATE (n:File {name: 'main.py'}) RETURN id(n) AS id"),
+            ([('n', 'File', {'name': 'main.py'})], [])
+        )
+
+    def test_path(self):
+        self.assertEqual(
+            parse_create_pattern("CREATE (a:Class {name:'A'})-[:DEFINES]->(b:Function {name:'f'})"),
+            ([('a', 'Class', {'name': 'A'}), ('b', 'Function', {'name': 'f'})], [('a', 'DEFINES', 'b')])
+        )
+
+    def test_several_nodes_and_reversed_relationship(self):
+        self.assertEqual(
+            parse_create_pattern("CREATE (a:X {name:'a'}), (b:Y {name:'b'}), (a)<-[:USES]-(b)"),
+            ([('a', 'X', {'name': 'a'}), ('b', 'Y', {'name': 'b'})], [('b', 'USES', 'a')])
+        )
+
+    def test_anonymous_nodes(self):
+        self.assertEqual(
+            parse_create_pattern("CREATE (:X {name:'a'})-[:`HAS PART`]->(:Y)"),
+            ([('#0', 'X', {'name': 'a'}), ('#1', 'Y', {})], [('#0', 'HAS PART', '#1')])
+        )
+
+    def test_unsupported_statements(self):
+        for statement in (
+            "CREATE (a)-[:R]->(b:X)",
+            "CREATE (a:X)-[:R]-(b:Y)",
+            "CREATE (a:X {name: 'a'}) SET a.size = 1",
+            "MATCH (a:X) CREATE (a)-[:R]->(b:Y)",
+        ):
+            self.assertIsNone(parse_create_pattern(statement), statement)
+
+
+class ValidateStatementTest(unittest.TestCase):
+
+    def test_path_create(self):
+        validate_statement("CREATE (a:Class {name:'A'})-[:DEFINES]->(b:Function {name:'f'})")
+
+    def test_multi_node_create(self):
+        validate_statement("CREATE (a:X {name:'a'}), (b:Y {name:'b'})")
+
+    def test_relationship_between_matched_nodes(self):
+        validate_statement("MATCH (a:Class {name:'A'}), (b:Function {name:'f'}) CREATE (a)-[:DEFINES]->(b)")
+
+    def test_invalid_properties_of_single_node(self):
+        with self.assertRaises(OpenCypherParseError):
+            validate_statement("CREATE (n:File {name: main}) RETURN id(n)")
+
+    def test_return_of_another_variable(self):
+        with self.assertRaises(OpenCypherParseError):
+            validate_statement("CREATE (n:File {name: 'main.py'}) RETURN id(m)")
+
+    def test_forbidden_clause(self):
+        with self.assertRaises(OpenCypherParseError):
+            validate_statement("MATCH (n) DETACH DELETE n")
+
+    def test_keywords_inside_strings(self):
+        validate_statement("CREATE (n:Function {name: 'delete'})")
+
+
+class SplitStatementsTest(unittest.TestCase):
+
+    def test_semicolons_inside_strings(self):
+        self.assertEqual(
+            split_statements("CREATE (n:A {name: 'a;b'}); CREATE (m:B {name: 'c'});"),
+            ["CREATE (n:A {name: 'a;b'})", "CREATE (m:B {name: 'c'})"]
+        )
+
+    def test_unbalanced_brackets(self):
+        with self.assertRaises(OpenCypherParseError):
+            split_statements("CREATE (n:A {name: 'a'}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,7 @@ import * as cdk from "aws-cdk-lib";
 import { Construct } from "constructs";
 import * as batch from "aws-cdk-lib/aws-batch";
 import * as ecs from "aws-cdk-lib/aws-ecs";
+import * as ecrAssets from "aws-cdk-lib/aws-ecr-assets";
 import * as ec2 from "aws-cdk-lib/aws-ec2";
 import * as lambda from "aws-cdk-lib/aws-lambda";
 
@@ -18,6 +19,11 @@ export interface AwsBatchAnalysisProps extends cdk.StackProps {
   readonly neptuneGraphId: string;
   readonly enableGraphParam: cdk.CfnParameter;
   readonly enableResearchAgentParam: cdk.CfnParameter;
+  readonly shardsParam: cdk.CfnParameter;
+  readonly jobAttemptsParam: cdk.CfnParameter;
+  readonly repositoriesParam: cdk.CfnParameter;
+  readonly incrementalParam: cdk.CfnParameter;
+  readonly refreshScheduleParam: cdk.CfnParameter;
 }
 
 const defaultProps: Partial<AwsBatchAnalysisProps> = {};
@@ -40,11 +46,22 @@ export class AwsBatchAnalysisConstruct extends Construct {
         enforceSSL: true,
       });
 
+      // The S3 backend of the LLM response cache has no eviction, entries are generated again once expired
+      s3Bucket.addLifecycleRule({
+        id: 'ExpireLlmCache',
+        prefix: 'llm-cache/',
+        expiration: cdk.Duration.days(30),
+      });
+
       new cdk.aws_s3_deployment.BucketDeployment(this, "CodeProcessingBucketScript", {
         sources: [
           cdk.aws_s3_deployment.Source.asset(
               "lib/assets/scripts/documentation_generation"
           ),
+          // Modules shared with the research agent
+          cdk.aws_s3_deployment.Source.asset(
+              "lib/assets/scripts/common"
+          ),
         ],
         destinationBucket: s3Bucket,
         destinationKeyPrefix: "code-processing",
@@ -56,6 +73,9 @@ export class AwsBatchAnalysisConstruct extends Construct {
             cdk.aws_s3_deployment.Source.asset(
                 "lib/assets/scripts/research_agent"
             ),
+            cdk.aws_s3_deployment.Source.asset(
+                "lib/assets/scripts/common"
+            ),
           ],
           destinationBucket: s3Bucket,
           destinationKeyPrefix: "research-agent",
@@ -128,9 +148,18 @@ export class AwsBatchAnalysisConstruct extends Construct {
 
       s3Bucket.grantReadWrite(jobExecutionRole);
 
+      // Optional image with the scripts and their dependencies baked in, built from lib/assets/scripts/Dockerfile.
+      // Enabled with `npx cdk deploy -c prebakedImage=true`, it needs Docker where the stack is deployed.
+      const prebakedImage = String(this.node.tryGetContext('prebakedImage')) === 'true';
+      const image = prebakedImage
+        ? ecs.ContainerImage.fromAsset('lib/assets/scripts', {
+            platform: ecrAssets.Platform.LINUX_AMD64,
+          })
+        : ecs.ContainerImage.fromRegistry('public.ecr.aws/amazonlinux/amazonlinux:latest');
+
       const jobDefinition = new batch.EcsJobDefinition(this, 'QBusinessJob', {
         container: new batch.EcsFargateContainerDefinition(this, 'Container', {
-          image: ecs.ContainerImage.fromRegistry('public.ecr.aws/amazonlinux/amazonlinux:latest'),
+          image,
           memory: cdk.Size.gibibytes(2),
           cpu: 1,
           executionRole: jobExecutionRole,
@@ -149,10 +178,11 @@ export class AwsBatchAnalysisConstruct extends Construct {
         ],
       }));
 
-      // Bedrock Claude 3 sonnet permission
+      // Bedrock Claude 3 sonnet permission, streamed when BEDROCK_STREAMING is set
       jobExecutionRole.addToPolicy(new cdk.aws_iam.PolicyStatement({
         actions: [
           'bedrock:InvokeModel',
+          'bedrock:InvokeModelWithResponseStream',
         ],
         resources: [
           `arn:aws:bedrock:${cdk.Stack.of(this).region}::foundation-model/amazon.titan-embed-text-v1`,
@@ -174,6 +204,31 @@ export class AwsBatchAnalysisConstruct extends Construct {
         ]})
       );
 
+      // Neptune Analytics assumes this role to read the static graph the first run exports to the bucket
+      const graphImportRole = new cdk.aws_iam.Role(this, 'GraphImportRole', {
+        assumedBy: new cdk.aws_iam.ServicePrincipal('neptune-graph.amazonaws.com'),
+      });
+      s3Bucket.grantRead(graphImportRole, 'graph-export/*');
+
+      // Bulk import of the exported static graph into the empty graph
+      jobExecutionRole.addToPolicy(new cdk.aws_iam.PolicyStatement({
+        actions: [
+          "neptune-graph:StartImportTask",
+          "neptune-graph:GetImportTask",
+        ],
+        resources: [
+          `arn:aws:neptune-graph:${cdk.Stack.of(this).region}:${awsAccountId}:graph/${props.neptuneGraphId}`,
+          `arn:aws:neptune-graph:${cdk.Stack.of(this).region}:${awsAccountId}:import-task/*`,
+        ]})
+      );
+
+      jobExecutionRole.addToPolicy(new cdk.aws_iam.PolicyStatement({
+        actions: [
+          "iam:PassRole",
+        ],
+        resources: [graphImportRole.roleArn],
+      }));
+
 
       // Role to submit job
       const submitJobRole = new cdk.aws_iam.Role(this, 'QBusinessSubmitJobRole', {
@@ -197,6 +252,16 @@ export class AwsBatchAnalysisConstruct extends Construct {
         resources: [jobExecutionRole.roleArn],
       }));
 
+      // Sharded runs start the sync job shared by the shards before submitting them
+      submitJobRole.addToPolicy(new cdk.aws_iam.PolicyStatement({
+        actions: [
+          "qbusiness:StartDataSourceSyncJob",
+        ],
+        resources: [
+          `arn:aws:qbusiness:${cdk.Stack.of(this).region}:${awsAccountId}:application/*`,
+        ],
+      }));
+
       // Submit Job Role CloudWatch Logs
       submitJobRole.addToPolicy(new cdk.aws_iam.PolicyStatement({
         actions: [
@@ -228,6 +293,12 @@ export class AwsBatchAnalysisConstruct extends Construct {
           SSH_KEY_NAME: props.sshKeyName,
           ENABLE_GRAPH: props.enableGraphParam.valueAsString,
           NEPTUNE_GRAPH_ID: props.neptuneGraphId,
+          PREBAKED_IMAGE: String(prebakedImage),
+          GRAPH_IMPORT_ROLE_ARN: graphImportRole.roleArn,
+          SHARDS: props.shardsParam.valueAsString,
+          JOB_ATTEMPTS: props.jobAttemptsParam.valueAsString,
+          REPOSITORIES: props.repositoriesParam.valueAsString,
+          INCREMENTAL: props.incrementalParam.valueAsString,
         },
         layers: [props.boto3Layer],
         role: submitJobRole,
@@ -245,9 +316,37 @@ export class AwsBatchAnalysisConstruct extends Construct {
         logRetention: cdk.aws_logs.RetentionDays.ONE_DAY,
       });
 
+      // A stack update that changes the parameters of the run submits the job again
       new cdk.CustomResource(this, 'QBusinesssubmitBatchAnalysisJobCustomResource', {
         serviceToken: submitBatchAnalysisJobProvider.serviceToken,
+        properties: {
+          RepositoryUrl: props.repository,
+          Repositories: props.repositoriesParam.valueAsString,
+          Incremental: props.incrementalParam.valueAsString,
+          Shards: props.shardsParam.valueAsString,
+        },
+      });
+
+      // Optional submit the job on a schedule, i.e. a nightly incremental refresh
+      const refreshScheduleCondition = new cdk.CfnCondition(this, 'RefreshScheduleCondition', {
+        expression: cdk.Fn.conditionNot(cdk.Fn.conditionEquals(props.refreshScheduleParam.valueAsString, 'None')),
+      });
+      const refreshRule = new cdk.aws_events.CfnRule(this, 'RefreshScheduleRule', {
+        scheduleExpression: props.refreshScheduleParam.valueAsString,
+        targets: [{
+          id: 'SubmitBatchAnalysisJob',
+          arn: submitBatchAnalysisJob.functionArn,
+          input: JSON.stringify({ RequestType: 'Scheduled' }),
+        }],
+      });
+      refreshRule.cfnOptions.condition = refreshScheduleCondition;
+      const refreshPermission = new lambda.CfnPermission(this, 'RefreshSchedulePermission', {
+        action: 'lambda:InvokeFunction',
+        functionName: submitBatchAnalysisJob.functionName,
+        principal: 'events.amazonaws.com',
+        sourceArn: refreshRule.attrArn,
       });
+      refreshPermission.cfnOptions.condition = refreshScheduleCondition;
 
       if (cdk.Fn.conditionEquals(props.enableResearchAgentParam.valueAsString, 'true')) {
 
@@ -270,6 +369,7 @@ export class AwsBatchAnalysisConstruct extends Construct {
             SSH_KEY_NAME: props.sshKeyName,
             ENABLE_GRAPH: props.enableGraphParam.valueAsString,
             NEPTUNE_GRAPH_ID: props.neptuneGraphId,
+            PREBAKED_IMAGE: String(prebakedImage),
           },
           layers: [props.boto3Layer],
           role: submitJobRole,
@@ -61,6 +61,43 @@ export class QBusinessCodeAnalysisStack extends cdk.Stack {
       default: 'false'
     });
 
+    const incrementalParam = new cdk.CfnParameter(this, 'Incremental', {
+      type: 'String',
+      description: 'Only process the files added or modified since the previous run. Set to true to enable incremental runs, false to process every file.',
+      allowedValues: ['true', 'false'],
+      default: 'false'
+    });
+
+    // Optional schedule the job runs again on
+    const refreshScheduleParam = new cdk.CfnParameter(this, 'RefreshSchedule', {
+      type: 'String',
+      description: 'Optional. An EventBridge schedule expression the ingestion job runs again on, i.e. cron(0 2 * * ? *) for every night. Set Incremental to true to only process the files changed since the previous run.',
+      default: 'None'
+    });
+
+    // Optional list of repositories ingested by one job instead of RepositoryUrl
+    const repositoriesParam = new cdk.CfnParameter(this, 'Repositories', {
+      type: 'String',
+      description: 'Optional. A JSON list of repository URLs, or of objects with repo_url and the optional ssh_url and data_source_id, or the s3://bucket/key URI of one. All of them are ingested by one job.',
+      default: 'None'
+    });
+
+    const shardsParam = new cdk.CfnParameter(this, 'Shards', {
+      type: 'Number',
+      description: 'Number of AWS Batch array job children the files of the repository are split across. 1 processes the repository in a single job.',
+      minValue: 1,
+      maxValue: 10000,
+      default: 1
+    });
+
+    const jobAttemptsParam = new cdk.CfnParameter(this, 'JobAttempts', {
+      type: 'Number',
+      description: 'Number of attempts of every AWS Batch job. A retried job resumes from its checkpoint.',
+      minValue: 1,
+      maxValue: 10,
+      default: 3
+    });
+
     // Check if the repository url is provided
     const repositoryUrl = repositoryUrlParam.valueAsString;
     const projectName = projectNameParam.valueAsString;
@@ -135,6 +172,11 @@ export class QBusinessCodeAnalysisStack extends cdk.Stack {
       enableResearchAgentParam: enableResearchAgentParam,
       enableGraphParam: enableGraphParam,
       neptuneGraphId: neptuneGraphId,
+      shardsParam: shardsParam,
+      jobAttemptsParam: jobAttemptsParam,
+      repositoriesParam: repositoriesParam,
+      incrementalParam: incrementalParam,
+      refreshScheduleParam: refreshScheduleParam,
     });
 
     awsBatchConstruct.node.addDependency(qBusinessConstruct);